@@ -1,8 +1,32 @@
 #!/usr/bin/env python
 '''Usage:
-    ./cli.py weather
+    ./cli.py weather [--near=<latlon>] [--blocks=<file>]
     ./cli.py load_data <csv_file>
-    ./cli.py get_field <field>
+    ./cli.py append <csv_file>
+    ./cli.py pack <csv_file> <blocks_file>
+    ./cli.py build_icons
+    ./cli.py get_field <field> [--from=<datetime>] [--to=<datetime>] [--fill] [--every=<period>] [--agg=<aggregates>] [--format=<format>]
+    ./cli.py stations [--near=<latlon>] [--like=<station>] [--n=<n>]
+    ./cli.py export --from=<datetime> --to=<datetime> [--step=<step>] [--stations=<stations>] [--fields=<fields>] [--workers=<n>] [--year=<year>] [--seed=<seed>] [--warming=<degrees>]
+
+Options:
+    --from=<datetime>     first forecast time, e.g. 2019-05-01T00:00
+    --to=<datetime>       forecasts stop before this time.
+    --step=<step>         time between forecasts, e.g. 30m, 1h, 1d [default: 1h]
+    --stations=<stations> comma separated station ids.
+    --fields=<fields>     comma separated fields, e.g. current_weather.temperature,daily
+    --workers=<n>         number of worker processes [default: 1]
+    --year=<year>         historical year to draw weather data from.
+    --seed=<seed>         seed for choosing historical years.
+    --warming=<degrees>   degrees Fahrenheit of warming [default: 0]
+    --fill                replace blank readings with the last value.
+    --every=<period>      resample by hour, day or month.
+    --agg=<aggregates>    min, mean, max, count or percentiles like p90 [default: min,mean,max]
+    --format=<format>     csv or json [default: csv]
+    --near=<latlon>       a place, e.g. 30.27,-97.74, to use the nearest station.
+    --like=<station>      a station id, to list stations with a similar climate.
+    --n=<n>               number of stations to list [default: 5]
+    --blocks=<file>       read weather data from a file written by pack.
 '''
 
 import datetime
@@ -13,6 +37,18 @@ from docopt import docopt
 from speculative_weather_report import CurrentWeather, DailyWeather, \
                                        Forecast, HourlyWeather, News, \
                                        Sunrise, Sunset, Weather
+from speculative_weather_report.data import HISTORICAL_STATION, \
+                                            increment_paths, \
+                                            load_historical_data, \
+                                            pack_blocks, write_increment
+from speculative_weather_report.historical import HistoricalData
+from speculative_weather_report.icons import write_sprite
+from speculative_weather_report.export import iter_export, parse_step
+from speculative_weather_report.snapshot import Snapshot, load_historical
+from speculative_weather_report.stations import StationCatalog
+from speculative_weather_report.timeline import timelines
+from speculative_weather_report.query import query_field, write_csv, \
+                                             write_json
 
 def print_weather(f):
     sys.stdout.write(
@@ -105,7 +141,6 @@ def print_weather(f):
 if __name__=='__main__':
     arguments = docopt(__doc__)
 
-    f = Forecast(datetime.datetime.now()).asdict()
     if arguments['load_data']:
         conn = sqlite3.connect('weather.db')
         c = conn.cursor()
@@ -114,7 +149,97 @@ if __name__=='__main__':
         DATE    - alwys same format. 
         '''
         pass
+    elif arguments['append']:
+        readings = load_historical().new_readings(
+            load_historical_data(arguments['<csv_file>'],
+                                 stations={HISTORICAL_STATION})
+        )
+        if readings:
+            path = write_increment([row for t, row in readings])
+            sys.stdout.write('appended {} readings to {}\n'.format(
+                len(readings), path))
+        else:
+            sys.stdout.write('no new readings\n')
+    elif arguments['pack']:
+        pack_blocks(arguments['<csv_file>'], arguments['<blocks_file>'])
+    elif arguments['build_icons']:
+        sys.stdout.write('wrote {}\n'.format(write_sprite()))
     elif arguments['get_field']:
-        pass
+        field = arguments['<field>']
+        start = arguments['--from'] and \
+                datetime.datetime.fromisoformat(arguments['--from'])
+        end = arguments['--to'] and \
+              datetime.datetime.fromisoformat(arguments['--to'])
+        # Only the field and the requested dates are parsed.
+        fields = ('DATE', field) if field != 'DATE' else ('DATE',)
+        stations = {HISTORICAL_STATION}
+        historical = HistoricalData.load(fields=fields, stations=stations,
+                                         start=start, end=end)
+        for path in increment_paths():
+            historical = historical.appended(
+                load_historical_data(path, fields, stations, start, end),
+                fields
+            )
+        rows = query_field(
+            historical,
+            field,
+            start=start,
+            end=end,
+            fill=arguments['--fill'],
+            period=arguments['--every'],
+            aggregates=arguments['--agg'].split(',')
+        )
+        if arguments['--format'] == 'json':
+            write_json(rows, sys.stdout)
+        else:
+            write_csv(rows, sys.stdout)
+    elif arguments['export']:
+        options = {'warming': int(arguments['--warming'])}
+        if arguments['--year']:
+            options['year'] = int(arguments['--year'])
+        if arguments['--seed']:
+            options['seed'] = arguments['--seed']
+        lines = iter_export(
+            datetime.datetime.fromisoformat(arguments['--from']),
+            datetime.datetime.fromisoformat(arguments['--to']),
+            parse_step(arguments['--step']),
+            stations=arguments['--stations'] and \
+                     arguments['--stations'].split(','),
+            fields=arguments['--fields'] and arguments['--fields'].split(','),
+            workers=int(arguments['--workers']),
+            **options
+        )
+        for line in lines:
+            sys.stdout.write(line + '\n')
+    elif arguments['stations']:
+        catalog = StationCatalog.load()
+        n = int(arguments['--n'])
+        if arguments['--near']:
+            latitude, longitude = map(float, arguments['--near'].split(','))
+            results = [(s, '{:.0f} km'.format(d))
+                       for s, d in catalog.nearest(latitude, longitude, n)]
+        elif arguments['--like']:
+            results = [(s, '{:.1f}'.format(d))
+                       for s, d in catalog.similar(arguments['--like'], n)]
+        else:
+            results = [(s, '') for s in catalog]
+        for s, distance in results:
+            sys.stdout.write('{:<12} {:>9} {}\n'.format(s.id, distance,
+                                                        s.name))
     elif arguments['weather']:
-        print_weather(f)
+        station = None
+        if arguments['--near']:
+            latitude, longitude = map(float, arguments['--near'].split(','))
+            [(station, distance)] = StationCatalog.load().nearest(latitude,
+                                                                  longitude, 1)
+        now = datetime.datetime.now()
+        if arguments['--blocks']:
+            snapshot = Snapshot.load(
+                HistoricalData.load_window(arguments['--blocks'], now,
+                                           stations={HISTORICAL_STATION})
+            )
+            print_weather(Forecast(now, snapshot=snapshot).asdict())
+        elif station is not None:
+            print_weather(Forecast(now, station=station).asdict())
+        else:
+            print_weather(timelines.get())
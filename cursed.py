@@ -1,10 +1,10 @@
 import curses
-import datetime
 import time
-from speculative_weather_report import Forecast, News
+from speculative_weather_report import News
+from speculative_weather_report.timeline import timelines
 
 def main(stdscr):
-    f = Forecast(datetime.datetime.now()).asdict()
+    f = timelines.get()
 
     # Hide cursor, set up color. 
     curses.curs_set(0)
@@ -0,0 +1,41 @@
+# Load historical data once in the gunicorn master and share it with every
+# worker through a memory-mapped file, e.g.:
+#
+#     gunicorn -c gunicorn.conf.py -w 8 web:app
+#
+# The shared data includes every increment file, like a snapshot does.
+# `kill -HUP <master pid>` loads the data again into a new file and replaces
+# the workers; old workers finish their requests on the old file, which is
+# freed once they exit.
+#
+# The master also builds the icon sprite, before any worker serves it.
+#
+# Each worker keeps its own forecast timelines, started once the app is
+# loaded so that they are computed from the shared data. After filling them, a
+# worker computes one forecast an hour per location, for the hour that enters
+# the window.
+import os
+
+from speculative_weather_report.icons import write_sprite
+from speculative_weather_report.shared import SHARED_DATA_ENV, write_shared
+from speculative_weather_report.snapshot import load_historical
+from speculative_weather_report.timeline import timelines
+
+
+def on_starting(server):
+    write_sprite()
+    os.environ[SHARED_DATA_ENV] = write_shared(load_historical())
+
+
+def on_reload(server):
+    previous = os.environ[SHARED_DATA_ENV]
+    os.environ[SHARED_DATA_ENV] = write_shared(load_historical())
+    os.unlink(previous)
+
+
+def post_worker_init(worker):
+    timelines.start()
+
+
+def on_exit(server):
+    os.unlink(os.environ.pop(SHARED_DATA_ENV))
@@ -1,2 +1,9 @@
 from .classes import Forecast, Weather, CurrentWeather, DailyWeather, \
                      HourlyWeather, Sunrise, Sunset, News
+from .climate import MonthlyNormals, Scenario
+from .data import iter_historical_chunks, load_historical_data
+from .events import EventIndex
+from .historical import HistoricalData, YearPartition
+from .snapshot import Snapshot, SnapshotManager, snapshots
+from .stations import Station, StationCatalog
+from .timeline import TimelineScheduler, timelines
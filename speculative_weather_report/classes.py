@@ -1,29 +1,26 @@
 import astral
-import csv
 import datetime
-import math
-import os
 import random
 import re
-import statistics
 
+from .climate import CARBON_COUNTS, Scenario, heat_index, heat_indexes
+from .events import SKY_CONDITIONS, WEATHER_TYPES, sky_code, weather_codes
+from .icons import icon_for
+from .snapshot import snapshots
 
-def load_historical_data_headers():
-    """Load the headers for historical weather data."""
-    with open(os.path.dirname(os.path.realpath(__file__)) + '/../data/1711054.csv') as f:
-        reader = csv.reader(f)
-        return next(reader, None)
 
+def clock_time(date_string):
+    """Format the time of an NCEI DATE.
 
-def load_historical_data():
-    """Load historical weather data."""
-    with open(os.path.dirname(os.path.realpath(__file__)) + '/../data/1711054.csv') as f:
-        reader = csv.reader(f)
-        next(reader, None)
-        historical_data = []
-        for row in reader:
-            historical_data.append(row)
-        return historical_data
+    Args:
+        date_string (str): e.g. '2010-05-01T14:51:00'
+
+    Returns:
+        str: e.g. '2:51PM'
+    """
+    hour = int(date_string[11:13])
+    return '{}:{}{}'.format(hour % 12 or 12, date_string[14:16],
+                            'PM' if hour >= 12 else 'AM')
 
 
 class Forecast:
@@ -37,21 +34,33 @@ class Forecast:
         eclipses.
 
         An alternate location allows the display to show historical weather data
-        from a place with different climate. For example, on May 1st of this
-        year in Chicago, Illinois, the forecast might display weather data from
-        May 1st, 2010 in Austin, Texas. Using historical data gives us realistic
-        looking data without having to do any weather modeling.
+        from a place with different climate; see StationCatalog for finding
+        one. For example, on May 1st of this year in Chicago, Illinois, the
+        forecast might display weather data from May 1st, 2010 in Austin,
+        Texas. Using historical data gives us realistic looking data without
+        having to do any weather modeling.
 
         Finally, the forecast displays a year in the future where the day of
         week (e.g. Tuesday) matches the current day of the week. The forecast
         also includes a news feed and advertisements, to explore the context
         around the weather. 
 
+        Historical data can come from any loaded year. By default one year is
+        chosen at random for each display; see HistoricalData.year_sampler for
+        choosing a year per day or per forecast cell instead. A warming
+        scenario can be layered over the historical data to show the same
+        weather a few degrees warmer.
+
         This object is designed to be instantiated once for each weather
-        forecast display.
+        forecast display. Forecasts and their cells use __slots__, since
+        busy displays build thousands of them a minute.
     """
 
-    def __init__(self, dt):
+    __slots__ = ('dt', 'astral', 'astral_city', 'snapshot',
+                 'current_weather', 'daily', 'hourly', 'news')
+
+    def __init__(self, dt, year=None, year_selection='display', seed=None,
+                 warming=0, normalize=False, snapshot=None, station=None):
         """constructor.
 
         Creates a new Forecast object, and instantiates Weather objects to
@@ -61,28 +70,50 @@ class Forecast:
         Args:
             dt (datetime.datetime): the current datetime, i.e.
             datetime.datetime.now()
+            year (int): a historical year to draw all weather data from.
+            year_selection (str): 'display', 'day' or 'random'.
+            seed: a seed for repeatable historical year choices.
+            warming (int): degrees Fahrenheit of warming to apply.
+            normalize (bool): remove each historical year's anomaly against
+            the monthly normals before applying warming. With a station, this
+            needs normals for that station; see MonthlyNormals.for_station.
+            snapshot (Snapshot): data to use instead of the current snapshot.
+            station (Station): a station to draw weather data from instead,
+            e.g. one from StationCatalog.nearest. A station id works too, for
+            stations in the default historical data file.
         """
         self.dt = dt
         self.astral = astral.Astral()
         self.astral_city = 'Chicago'
 
-        self.current_weather = CurrentWeather(dt)
+        if snapshot is not None:
+            self.snapshot = snapshot
+        elif isinstance(station, str):
+            self.snapshot = snapshots.for_station(station)
+        elif station is not None:
+            self.snapshot = snapshots.for_station(station.id, station.path)
+        else:
+            self.snapshot = snapshots.current()
+        year_for = self.snapshot.historical.year_sampler(year_selection,
+                                                         year, seed, dt)
+        scenario = Scenario(warming, self.snapshot.normals, normalize)
+
+        self.current_weather = CurrentWeather(dt, year_for(dt), scenario,
+                                              self.snapshot)
 
         self.daily = []
         d = self.current_weather.dt.replace(hour=0, minute=0, second=0)
         for i in range(1, 7):
-            self.daily.append(
-                DailyWeather(
-                    d + datetime.timedelta(days=i)
-                )
-            )
+            day = d + datetime.timedelta(days=i)
+            self.daily.append(DailyWeather(day, year_for(day), scenario,
+                                           self.snapshot))
 
         self.hourly = []
         d = self.current_weather.dt.replace(minute=0, second=0)
         for i in range(1, 25):
-            self.hourly.append(
-                HourlyWeather(d + datetime.timedelta(hours=i))
-            )
+            hour = d + datetime.timedelta(hours=i)
+            self.hourly.append(HourlyWeather(hour, year_for(hour), scenario,
+                                             self.snapshot))
 
         self.news = News()
 
@@ -185,25 +216,40 @@ class Forecast:
             dict: a dictionary containing the current weather, daily and hourly
             weather forecasts and astronomical events, news and advertisements.
         """
+        hourly = [h.asdict() for h in self.hourly]
+        for cell, i in zip(hourly, HourlyWeather.heat_indexes(self.hourly)):
+            cell['heat_index'] = i
         return {
             'current_weather': self.current_weather.asdict(),
             'daily':           [d.asdict() for d in self.daily],
-            'hourly':          [h.asdict() for h in self.hourly],
+            'hourly':          hourly,
             'news':            self.news.asdict()
         }
 
 
 class Weather:
-    historical_headers = load_historical_data_headers()
-    historical_data = load_historical_data()
+    __slots__ = ('dt', 'historical', 'year', 'scenario', '_view', '_index')
 
-    def __init__(self, dt):
+    def __init__(self, dt, year=None, scenario=None, snapshot=None):
         """Constructor
 
         Args:
             dt (datetime.datetime)
+            year (int): the historical year to draw weather data from.
+            Defaults to the earliest loaded year.
+            scenario (Scenario): a warming scenario. Defaults to no warming.
+            snapshot (Snapshot): data to use instead of the current snapshot.
         """
         self.dt = dt
+        if snapshot is None:
+            snapshot = snapshots.current()
+        self.historical = snapshot.historical
+        self.year = year if year is not None else self.historical.years[0]
+        self.scenario = scenario if scenario is not None else Scenario()
+        # The partition view and closest past reading, looked up once and
+        # shared by every field of the cell.
+        self._view = None
+        self._index = None
 
     def as_of(self):
         """Get the most recent reading time from historical data.
@@ -212,10 +258,7 @@ class Weather:
             str: the date and time of the most recent weather data reading in
             YYYY-mm-ddTHH:MM:SS format. 
         """
-        return datetime.datetime.strptime(
-            self._get_historical('DATE'),
-            '%Y-%m-%dT%H:%M:%S'
-        ).strftime('%-I:%M%p')
+        return clock_time(self._get_historical('DATE'))
 
     def carbon_count(self, temperature_increase):
         """Get an estimated carbon count for a given temperature increase.
@@ -231,8 +274,7 @@ class Weather:
         Returns:
             int: the carbon count.
         """
-        carbon_counts = (410, 480, 550, 630, 700, 800, 900, 1000, 1200, 1400)
-        return carbon_counts[temperature_increase]
+        return CARBON_COUNTS[temperature_increase]
 
     def dew_point(self):
         """Get the dew point.
@@ -249,25 +291,7 @@ class Weather:
         Returns:
             int: a heat index temperature in Fahrenheit.
         """
-        t = self.temperature()
-        if t < 80:
-            return None
-        r = self.relative_humidity()
-        if r < 40:
-            return None
-        return int(
-            sum(
-                [-42.379,
-                   2.04901523   * t,
-                  10.14333127   * r,
-                  -0.22475541   * t * r,
-                  -6.83783e-03  * math.pow(t, 2),
-                  -5.481717e-02 * math.pow(r, 2),
-                   1.22874e-03  * math.pow(t, 2) * r,
-                   8.5282e-04   * t * math.pow(r, 2),
-                  -1.99e-06     * math.pow(t, 2) * math.pow(r, 2)]
-            )
-        )
+        return heat_index(self.temperature(), self.relative_humidity())
 
     def human_readable_datetime(self):
         """Get a human readable datetime string for this object.
@@ -285,6 +309,17 @@ class Weather:
         """
         return int(self._get_historical('HourlyRelativeHumidity'))
 
+    def icon(self):
+        """Get the icon for the current weather.
+
+        Returns:
+            str: the name of a symbol in the icon sprite, e.g. 'rain'
+        """
+        return icon_for(
+            sky_code(self._get_historical('HourlySkyConditions')),
+            weather_codes(self._get_historical('HourlyPresentWeatherType'))
+        )
+
     def sky_conditions(self):
         """Get sky conditions.
 
@@ -310,21 +345,8 @@ class Weather:
         Returns:
             str: current sky conditions, e.g. 'clear sky'
         """
-        conditions = {
-           'CLR': 'clear sky',
-           'FEW': 'few clouds',
-           'SCT': 'scattered clouds',
-           'BKN': 'broken clouds',
-           'OVC': 'overcast'
-        }
-        matches = re.search(
-            '([A-Z]{3}).*$',
-            self._get_historical('HourlySkyConditions')
-        )
-        try:
-            return conditions[matches.group(1)]
-        except AttributeError:
-            return self._get_historical('HourlySkyConditions')
+        sky_conditions = self._get_historical('HourlySkyConditions')
+        return SKY_CONDITIONS.get(sky_code(sky_conditions), sky_conditions)
 
     def temperature(self):
         """Get the dry bulb temperature ("the temperature")
@@ -372,34 +394,11 @@ class Weather:
         Returns: 
             str: a description of the current weather, e.g. 'fog'
         """
-        weather_strings = {
-            'FG':   'fog',
-            'TS':   'thunder',
-            'PL':   'sleet',
-            'GR':   'hail',
-            'GL':   'ice sheeting',
-            'DU':   'dust',
-            'HZ':   'haze',
-            'BLSN': 'drifing snow',
-            'FC':   'funnel cloud',
-            'WIND': 'high winds',
-            'BLPY': 'blowing spray',
-            'BR':   'mist',
-            'DZ':   'drizzle',
-            'FZDZ': 'freezing drizzle',
-            'RA':   'rain',
-            'FZRA': 'freezing rain',
-            'SN':   'snow',
-            'UP':   'precipitation',
-            'MIFG': 'ground fog',
-            'FZFG': 'freezing fog'
-        }
         types = set()
         present_weather = self._get_historical('HourlyPresentWeatherType')
-        for p in present_weather.split('|'):
-            m = re.search('[A-Z]+', p)
-            if m:
-                types.add(weather_strings[m.group(0)])
+        for code in weather_codes(present_weather):
+            if code in WEATHER_TYPES:
+                types.add(WEATHER_TYPES[code])
         return ', '.join(list(types))
 
     def wind_direction_and_speed(self):
@@ -420,6 +419,18 @@ class Weather:
         s = self._get_historical('HourlyWindSpeed')
         return '{}mph {}'.format(s, direction)
 
+    def _partition(self):
+        """Get this object's historical year, as seen under its scenario.
+
+        Returns:
+            YearPartition or ScenarioPartition
+        """
+        if self._view is None:
+            self._view = self.scenario.view(
+                self.historical.partition(self.year)
+            )
+        return self._view
+
     def _get_closest_past_index(self, dt=None):
         """Find the closest past index represented in historical data for a
         given date/time string.
@@ -428,22 +439,17 @@ class Weather:
             dt (datetime.datetime): A datetime to look up other than self.dt.
 
         Returns:
-            int: an index (record number) in the historical data.
+            int: an index (record number) in this object's historical year.
         """
-        if not dt:
-            dt = self.dt
-        dt_string = dt.replace(year=2010).strftime('%Y-%m-%dT%H:%M:%S')
-        f = self.historical_headers.index('DATE')
-        i = len(self.historical_data) - 1
-        while i >= 0:
-            if self.historical_data[i][f] < dt_string:
-                break
-            i -= 1
-        return i
+        if dt:
+            return self._partition().closest_past_index(dt)
+        if self._index is None:
+            self._index = self._partition().closest_past_index(self.dt)
+        return self._index
 
     def _get_historical(self, field):
         """Get a single historical data point. If the current data point is
-        blank, the function searches backwards for the last available data.
+        blank, the most recent earlier value is returned instead.
 
         Args:
             field (str): the field name.
@@ -451,30 +457,10 @@ class Weather:
         Returns:
             str: the data.
         """
-        i = self._get_closest_past_index()
-        f = self.historical_headers.index(field)
-        while i > 0:
-            if self.historical_data[i][f]:
-                return self.historical_data[i][f]
-            i -= 1
-        return ''
-
-    def _get_historical_daily_range(self, field):
-        """Get a range of historical data points. 
-
-        Args:
-            field (str): the field name.
-
-        Returns:
-            str: the data.
-        """
-        start_of_day = self.dt.replace(hour=0, minute=0, second=0)
-        i1 = self._get_closest_past_index(start_of_day)
-        i2 = self._get_closest_past_index(
-            start_of_day + datetime.timedelta(days=1)
+        return self._partition().value(
+            field,
+            self._get_closest_past_index()
         )
-        f = self.historical_headers.index(field)
-        return [self.historical_data[i][f] for i in range(i1, i2 + 1)]
 
     def _temperature_summary(self, summary_type):
         """Get a temperature summary for the day.
@@ -485,21 +471,10 @@ class Weather:
         Returns:
             int: the temperature summary in Fahrenheit.
         """
-        temperatures = map(
-            int,
-            filter(
-                bool,
-                self._get_historical_daily_range('HourlyDryBulbTemperature')
-            )
+        return self._partition().daily_summary(
+            self.dt,
+            summary_type
         )
-        if summary_type == 'min':
-            return min(temperatures)
-        elif summary_type == 'max':
-            return max(temperatures)
-        elif summary_type == 'mean':
-            return int(statistics.mean(temperatures))
-        else:
-            raise ValueError
 
     def future_year_with_same_weekday(self, min_future_year):
         """Get a future year with the same weekday (e.g. "Tuesday") as self.dt.
@@ -526,9 +501,10 @@ class Weather:
             'as_of':                    self.as_of(),
             'human_readable_datetime':  self.human_readable_datetime(),
             'simulation_year':          self.future_year_with_same_weekday(2060),
-            'carbon_count':             self.carbon_count(0),
+            'carbon_count':             self.carbon_count(self.scenario.warming),
             'dew_point':                self.dew_point(),
             'heat_index':               self.heat_index(),
+            'icon':                     self.icon(),
             'relative_humidity':        self.relative_humidity(),
             'sky_conditions':           self.sky_conditions(),
             'temperature':              self.temperature(),
@@ -542,6 +518,8 @@ class Weather:
 
 
 class CurrentWeather(Weather):
+    __slots__ = ()
+
     def human_readable_datetime(self):
         """Get a human readable date and time for the current weather, e.g.
         'Tuesday, May 1.'
@@ -552,6 +530,8 @@ class CurrentWeather(Weather):
         return self.dt.strftime('%A, %B %-d')
 
 class DailyWeather(Weather):
+    __slots__ = ()
+
     def human_readable_datetime(self):
         """Get a human readable date and time for each cell in a daily weather
         forecast, e.g. 'Tuesday'
@@ -577,6 +557,50 @@ class DailyWeather(Weather):
         }
 
 class HourlyWeather(Weather):
+    __slots__ = ()
+
+    @staticmethod
+    def heat_indexes(cells):
+        """Get the heat index of a strip of hourly cells.
+
+        Notes:
+            Cells are grouped by the historical year they draw from, and each
+            group's heat indexes are computed in one pass over its shifted
+            hourly grids.
+
+        Args:
+            cells (list): HourlyWeather objects.
+
+        Returns:
+            list: heat indexes in Fahrenheit, None where it does not apply.
+        """
+        groups = {}
+        for k, cell in enumerate(cells):
+            view = cell._partition()
+            group = groups.setdefault(id(view), (view, [], []))
+            group[1].append(k)
+            group[2].append(cell.dt)
+        indexes = [None] * len(cells)
+        for view, positions, dts in groups.values():
+            for k, i in zip(positions, heat_indexes(
+                view.hourly_numbers('HourlyDryBulbTemperature', dts),
+                view.hourly_numbers('HourlyRelativeHumidity', dts)
+            )):
+                indexes[k] = i
+        return indexes
+
+    def _get_historical(self, field):
+        """Get a single historical data point for this hour from the
+        pre-resampled hourly grid.
+
+        Args:
+            field (str): the field name.
+
+        Returns:
+            str: the data.
+        """
+        return self._partition().hourly_value(field, self.dt)
+
     def human_readable_datetime(self):
         """Get a human readable date and time for each cell in an hourly
         forecast, e.g. '2PM'
@@ -596,20 +620,27 @@ class HourlyWeather(Weather):
             'as_of':                    self.as_of(),
             'dt':                       self.dt,
             'human_readable_datetime':  self.human_readable_datetime(),
+            'icon':                     self.icon(),
             'temperature':              self.temperature(),
         }
 
 class Sunrise(Weather):
+    __slots__ = ()
+
     def human_readable_datetime(self):
         raise NotImplementedError
 
 
 class Sunset(Weather):
+    __slots__ = ()
+
     def human_readable_datetime(self):
         raise NotImplementedError
 
 
 class News:
+    __slots__ = ()
+
     def get_advertisement(self):
         ads = (("Skirts, blouses and accessories. Up to 45% off. Shop Now.", "Noracora"),
                ("Your future's looking up with our new student loan. Competitive interest rates. Multiple repayment options. No origination fee. Get started now.", "Sallie Mae"),
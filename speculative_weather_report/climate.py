@@ -0,0 +1,408 @@
+import bisect
+import csv
+import math
+import os
+from array import array
+
+from .historical import parse_number
+
+NORMALS_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    '..',
+    'data',
+    '1709000.csv'
+)
+
+# Where MonthlyNormals.for_station looks for normals files.
+NORMALS_DIRECTORY = os.path.dirname(NORMALS_PATH)
+
+NORMALS_FIELDS = (
+    'MLY-TAVG-NORMAL',
+    'MLY-TMAX-NORMAL',
+    'MLY-TMIN-NORMAL',
+    'MLY-TAVG-STDDEV'
+)
+
+# Atmospheric carbon (ppm) for each degree Fahrenheit of warming. This is a
+# very rough estimate based on the following document:
+# http://dels.nas.edu/resources/static-assets/
+# materials-based-on-reports/booklets/warming_world_final.pdf
+CARBON_COUNTS = (410, 480, 550, 630, 700, 800, 900, 1000, 1200, 1400)
+
+# Fields that move with the warming delta. Relative humidity is assumed to stay
+# the same, so the dew point rises along with the temperature.
+SHIFTED_FIELDS = ('HourlyDryBulbTemperature', 'HourlyDewPointTemperature')
+
+
+def heat_index(t, r):
+    """Calculate the heat index: see
+    https://en.wikipedia.org/wiki/Heat_index.
+
+    Args:
+        t (float): the temperature in Fahrenheit.
+        r (float): the relative humidity from 0 to 100.
+
+    Returns:
+        int: a heat index temperature in Fahrenheit, or None when it is too
+        cool or too dry for the heat index to apply.
+    """
+    if t < 80 or r < 40:
+        return None
+    return int(
+        sum(
+            [-42.379,
+               2.04901523   * t,
+              10.14333127   * r,
+              -0.22475541   * t * r,
+              -6.83783e-03  * math.pow(t, 2),
+              -5.481717e-02 * math.pow(r, 2),
+               1.22874e-03  * math.pow(t, 2) * r,
+               8.5282e-04   * t * math.pow(r, 2),
+              -1.99e-06     * math.pow(t, 2) * math.pow(r, 2)]
+        )
+    )
+
+
+def normals_station_id(station):
+    """Get the id that monthly normals use for a station.
+
+    Notes:
+        LCD files identify a station by its USAF and WBAN numbers, e.g.
+        '72530094846', while normals use its GHCN id, which for first order
+        stations is 'USW000' followed by the WBAN number, e.g. 'USW00094846'.
+
+    Args:
+        station (str): a station id, as in LCD files.
+
+    Returns:
+        str
+    """
+    if len(station) == 11 and station.isdigit():
+        return 'USW000' + station[-5:]
+    return station
+
+
+def heat_indexes(temperatures, humidities):
+    """Compute the heat index for runs of readings in one pass.
+
+    Args:
+        temperatures (iterable): in Fahrenheit, NaN where there is no reading.
+        humidities (iterable): relative humidities from 0 to 100, NaN where
+        there is no reading.
+
+    Returns:
+        list: heat indexes in Fahrenheit, None where it does not apply.
+    """
+    return [
+        None if math.isnan(t) or math.isnan(r) else heat_index(t, r)
+        for t, r in zip(temperatures, humidities)
+    ]
+
+
+class MonthlyNormals:
+    """NOAA monthly climate normals for a single station.
+
+    Notes:
+        Each normal is kept as a 12 element array, indexed by month - 1.
+    """
+
+    def __init__(self, station, normals):
+        """Constructor
+
+        Args:
+            station (str): the station id.
+            normals (dict): field name -> array of 12 floats.
+        """
+        self.station = station
+        self.normals = normals
+
+    @classmethod
+    def load(cls, path=NORMALS_PATH, fields=NORMALS_FIELDS):
+        """Load monthly normals from an NCEI file.
+
+        Args:
+            path (str): a monthly normals .csv file.
+            fields (tuple): the normals to keep.
+
+        Returns:
+            MonthlyNormals
+        """
+        normals = {f: array('d', [float('nan')] * 12) for f in fields}
+        station = ''
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                station = row['STATION']
+                m = int(row['DATE'][-2:]) - 1
+                for field in fields:
+                    v = parse_number(row.get(field, ''))
+                    # -7777 flags a value too small to report, -9999 a
+                    # missing one.
+                    if v == -7777:
+                        v = 0.0
+                    elif v is None or v == -9999:
+                        v = float('nan')
+                    normals[field][m] = v
+        return cls(station, normals)
+
+    @classmethod
+    def for_station(cls, station, directory=NORMALS_DIRECTORY,
+                    fields=NORMALS_FIELDS):
+        """Load the monthly normals for a station.
+
+        Notes:
+            Normals files are named after NCEI orders rather than stations,
+            so the first row of each .csv file in directory is checked.
+
+        Args:
+            station (str): a station id, as in LCD files.
+            directory (str)
+            fields (tuple): the normals to keep.
+
+        Returns:
+            MonthlyNormals: or None if no file has normals for the station.
+        """
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if not name.endswith('.csv'):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, newline='') as f:
+                row = next(csv.DictReader(f), None)
+            if row is None or 'MLY-TAVG-NORMAL' not in row:
+                continue
+            if row.get('STATION') in (station, normals_station_id(station)):
+                return cls.load(path, fields)
+        return None
+
+    def is_for(self, station):
+        """Check whether these are the normals for a station.
+
+        Args:
+            station (str): a station id, as in LCD files.
+
+        Returns:
+            bool
+        """
+        return self.station in (station, normals_station_id(station))
+
+    def __getitem__(self, field):
+        return self.normals[field]
+
+    def anomalies(self, partition):
+        """Get the monthly mean temperature anomalies of a historical year.
+
+        Args:
+            partition (YearPartition)
+
+        Returns:
+            array: 12 anomalies in Fahrenheit, 0 for months without readings.
+        """
+        return array('d', (
+            0.0 if math.isnan(m - n) else m - n
+            for m, n in zip(partition.monthly_means(),
+                            self.normals['MLY-TAVG-NORMAL'])
+        ))
+
+
+class Scenario:
+    """A warming scenario applied on top of historical weather data.
+
+    Notes:
+        The scenario shifts temperatures by a per-month offset: the warming
+        delta, minus the historical year's own anomaly against the normals when
+        normalize is set, so that an unusually hot or cold source year does
+        not skew the projection. Views are computed lazily and share storage
+        with the historical data.
+    """
+
+    def __init__(self, warming=0, normals=None, normalize=False):
+        """Constructor
+
+        Args:
+            warming (int): warming in Fahrenheit, an index into CARBON_COUNTS.
+            normals (MonthlyNormals): required when normalize is set.
+            normalize (bool): remove each historical year's anomaly.
+        """
+        if not 0 <= warming < len(CARBON_COUNTS):
+            raise ValueError('warming must be between 0 and {}'.format(
+                len(CARBON_COUNTS) - 1))
+        if normalize and normals is None:
+            raise ValueError('normalizing a scenario requires normals')
+        self.warming = warming
+        self.normals = normals
+        self.normalize = normalize
+        self._views = {}
+
+    @classmethod
+    def for_carbon_count(cls, carbon_count, **kwargs):
+        """Get the scenario for an atmospheric carbon count.
+
+        Args:
+            carbon_count (int): in ppm.
+
+        Returns:
+            Scenario: the scenario with the largest warming whose carbon count
+            does not exceed carbon_count.
+        """
+        warming = max(bisect.bisect_right(CARBON_COUNTS, carbon_count) - 1, 0)
+        return cls(warming, **kwargs)
+
+    @property
+    def carbon_count(self):
+        return CARBON_COUNTS[self.warming]
+
+    def offsets(self, partition):
+        """Get the temperature offset for each month of a historical year.
+
+        Args:
+            partition (YearPartition)
+
+        Returns:
+            array: 12 offsets in Fahrenheit.
+        """
+        offsets = array('d', [float(self.warming)] * 12)
+        if self.normalize:
+            for m, a in enumerate(self.normals.anomalies(partition)):
+                offsets[m] -= a
+        return offsets
+
+    def view(self, partition):
+        """Get a historical year as seen under this scenario.
+
+        Args:
+            partition (YearPartition)
+
+        Returns:
+            YearPartition or ScenarioPartition: the partition itself when the
+            scenario changes nothing.
+        """
+        if not self.warming and not self.normalize:
+            return partition
+        key = id(partition)
+        if key not in self._views or self._views[key].base is not partition:
+            self._views[key] = ScenarioPartition(partition,
+                                                 self.offsets(partition))
+        return self._views[key]
+
+
+class ScenarioPartition:
+    """A read-only view of a YearPartition with temperatures shifted by a
+    per-month offset.
+
+    Notes:
+        Nothing is copied: values are offset as they are read, and batches of
+        readings are offset one month-long run at a time.
+    """
+
+    def __init__(self, base, offsets):
+        """Constructor
+
+        Args:
+            base (YearPartition)
+            offsets (array): 12 offsets in Fahrenheit.
+        """
+        self.base = base
+        self.offsets = offsets
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def __len__(self):
+        return len(self.base)
+
+    def _month(self, i):
+        return bisect.bisect_right(self.base.month_bounds(), i) - 1
+
+    def value(self, field, i):
+        """Get the most recent non-blank value of a field at or before a
+        reading, shifted by the scenario.
+
+        Args:
+            field (str): the field name.
+            i (int): an index into the partition.
+
+        Returns:
+            str: the data, or '' if there is none.
+        """
+        v = self.base.value(field, i)
+        if field not in SHIFTED_FIELDS:
+            return v
+        n = parse_number(v)
+        if n is None:
+            return v
+        return str(int(round(n + self.offsets[self._month(i)])))
+
+    def hourly_value(self, field, dt):
+        """Get the value of a field for an hour, shifted by the scenario.
+
+        Args:
+            field (str): the field name.
+            dt (datetime.datetime): any year.
+
+        Returns:
+            str: the data, or '' if there is none.
+        """
+        v = self.base.hourly_value(field, dt)
+        if field not in SHIFTED_FIELDS:
+            return v
+        n = parse_number(v)
+        if n is None:
+            return v
+        return str(int(round(n + self.offsets[dt.month - 1])))
+
+    def hourly_numbers(self, field, dts):
+        """Get a linear field's values for a run of hours, shifted by the
+        scenario.
+
+        Args:
+            field (str): the field name.
+            dts (list): datetime.datetime objects, in any year.
+
+        Returns:
+            array: floats, NaN for hours without a value.
+        """
+        values = self.base.hourly_numbers(field, dts)
+        if field in SHIFTED_FIELDS:
+            offsets = self.offsets
+            for i, dt in enumerate(dts):
+                values[i] += offsets[dt.month - 1]
+        return values
+
+    def daily_summary(self, dt, summary_type):
+        """Get a temperature summary for a day, shifted by the scenario.
+
+        Args:
+            dt (datetime.datetime): any year; only the month and day are used.
+            summary_type (str): one of 'min', 'max', 'mean'
+
+        Returns:
+            int: the temperature summary in Fahrenheit.
+        """
+        return int(round(self.base.daily_summary(dt, summary_type) +
+                         self.offsets[dt.month - 1]))
+
+    def column(self, field, start, stop):
+        """Get a run of forward-filled, shifted readings as numbers.
+
+        Args:
+            field (str): the field name.
+            start (int): the first index.
+            stop (int): one past the last index.
+
+        Returns:
+            array: floats, NaN where there is no reading.
+        """
+        values = self.base.column(field, start, stop)
+        if field not in SHIFTED_FIELDS:
+            return values
+        bounds = self.base.month_bounds()
+        for m in range(12):
+            lo, hi = max(bounds[m], start) - start, \
+                     min(bounds[m + 1], stop) - start
+            if lo < hi:
+                values[lo:hi] = array('d', map(self.offsets[m].__add__,
+                                               values[lo:hi]))
+        return values
@@ -0,0 +1,415 @@
+import collections
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import os
+import struct
+import threading
+import zlib
+
+HISTORICAL_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    '..',
+    'data',
+    '1711054.csv'
+)
+
+# The station forecasts draw weather from by default: Chicago O'Hare, the
+# station the default monthly normals are for. HISTORICAL_DATA_PATH may hold
+# other stations too, e.g. for StationCatalog.
+HISTORICAL_STATION = '72530094846'
+
+# Readings added with `cli.py append`, applied in file name order on top of
+# HISTORICAL_DATA_PATH.
+INCREMENTS_DIRECTORY = os.path.join(
+    os.path.dirname(HISTORICAL_DATA_PATH),
+    'increments'
+)
+
+# NCEI Local Climatological Data files carry roughly a hundred columns, but a
+# forecast only reads these. Everything else is dropped while parsing.
+HISTORICAL_FIELDS = (
+    'STATION',
+    'DATE',
+    'LATITUDE',
+    'LONGITUDE',
+    'ELEVATION',
+    'NAME',
+    'HourlyDewPointTemperature',
+    'HourlyDryBulbTemperature',
+    'HourlyPresentWeatherType',
+    'HourlyRelativeHumidity',
+    'HourlySkyConditions',
+    'HourlyVisibility',
+    'HourlyWindDirection',
+    'HourlyWindSpeed'
+)
+
+CHUNK_SIZE = 10000
+
+BLOCKS_MAGIC = b'SWRBLK01'
+
+# Decompressed blocks kept in memory by each BlockStore.
+BLOCK_CACHE_SIZE = 32
+
+# Block file path -> ((mtime, size), BlockStore), see open_block_store.
+_block_stores = {}
+_block_stores_lock = threading.Lock()
+
+
+def open_historical_data(path):
+    """Open a historical data file for reading, decompressing it on the fly if
+    it is gzipped.
+
+    Args:
+        path (str): a .csv or .csv.gz file.
+
+    Returns:
+        file: a text mode file object.
+    """
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), newline='')
+    return open(path, newline='')
+
+
+def iter_historical_chunks(path=HISTORICAL_DATA_PATH, fields=HISTORICAL_FIELDS,
+                           stations=None, start=None, end=None,
+                           chunk_size=CHUNK_SIZE):
+    """Stream historical weather data in chunks.
+
+    Notes:
+        Rows are projected down to fields and filtered by station and date
+        while the file is parsed, so memory use is bounded by the size of a
+        chunk rather than by the size of the file. Fields that are missing
+        from the file come back as blank strings.
+
+        Block files written by pack_blocks are read through BlockStore, so
+        only the blocks between start and end are decompressed.
+
+    Args:
+        path (str): a .csv or .csv.gz NCEI file, or a .blocks file.
+        fields (tuple): the field names to keep, in order.
+        stations (set): station ids to keep, or None for every station.
+        start (datetime.datetime): skip readings before this time.
+        end (datetime.datetime): skip readings at or after this time.
+        chunk_size (int): the maximum number of rows in each chunk.
+
+    Yields:
+        list: a list of tuples, one per reading, ordered like fields.
+    """
+    if path.endswith('.blocks'):
+        yield from open_block_store(path).iter_chunks(fields, stations, start, end,
+                                                chunk_size=chunk_size)
+        return
+
+    start_string = start.strftime('%Y-%m-%dT%H:%M:%S') if start else None
+    end_string = end.strftime('%Y-%m-%dT%H:%M:%S') if end else None
+
+    with open_historical_data(path) as f:
+        reader = csv.reader(f)
+        headers = next(reader, None)
+        if headers is None:
+            return
+        positions = [headers.index(h) if h in headers else None
+                     for h in fields]
+        station_f = headers.index('STATION') if 'STATION' in headers else None
+        date_f = headers.index('DATE')
+        width = len(headers)
+
+        def project(row):
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            return tuple('' if p is None else row[p] for p in positions)
+
+        def keep(row):
+            if not row:
+                return False
+            if stations is not None and station_f is not None and \
+               row[station_f] not in stations:
+                return False
+            if start_string and row[date_f] < start_string:
+                return False
+            if end_string and row[date_f] >= end_string:
+                return False
+            return True
+
+        rows = map(project, filter(keep, reader))
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def load_historical_data(path=HISTORICAL_DATA_PATH, fields=HISTORICAL_FIELDS,
+                         stations=None, start=None, end=None):
+    """Load historical weather data.
+
+    Args:
+        path (str): a .csv or .csv.gz NCEI file.
+        fields (tuple): the field names to keep, in order.
+        stations (set): station ids to keep, or None for every station.
+        start (datetime.datetime): skip readings before this time.
+        end (datetime.datetime): skip readings at or after this time.
+
+    Returns:
+        list: a list of tuples, one per reading, ordered like fields.
+    """
+    historical_data = []
+    for chunk in iter_historical_chunks(path, fields, stations, start, end):
+        historical_data.extend(chunk)
+    return historical_data
+
+
+def increment_paths(directory=INCREMENTS_DIRECTORY):
+    """Get the increment files to apply on top of historical data.
+
+    Args:
+        directory (str)
+
+    Returns:
+        list: paths, in the order they were written.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in sorted(names)
+            if n.endswith('.csv') or n.endswith('.csv.gz')]
+
+
+def write_increment(rows, fields=HISTORICAL_FIELDS,
+                    directory=INCREMENTS_DIRECTORY):
+    """Write new readings to an increment file.
+
+    Notes:
+        The file is written under a temporary name and renamed into place,
+        so that processes watching the directory never read half of it.
+
+    Args:
+        rows (list): tuples ordered like fields.
+        fields (tuple): the field names.
+        directory (str)
+
+    Returns:
+        str: the path of the new file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory,
+        '{}.csv'.format(datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f'))
+    )
+    with open(path + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(fields)
+        writer.writerows(rows)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def pack_blocks(path, out_path, fields=HISTORICAL_FIELDS, level=9):
+    """Convert an NCEI file to a block file.
+
+    Notes:
+        Readings are split into one block per station and month. Each block
+        is compressed with zlib on its own, and a JSON index of blocks is
+        written at the end of the file, so a reader can decompress just the
+        blocks it needs. The file starts with a magic number and the offset of
+        the index.
+
+    Args:
+        path (str): a .csv or .csv.gz NCEI file.
+        out_path (str): the .blocks file to write.
+        fields (tuple): the field names to keep; must include 'DATE'.
+        level (int): the zlib compression level.
+
+    Returns:
+        str: out_path.
+    """
+    d = fields.index('DATE')
+    s = fields.index('STATION') if 'STATION' in fields else None
+    blocks = []
+    with open(out_path + '.tmp', 'wb') as f:
+        f.write(BLOCKS_MAGIC + struct.pack('<Q', 0))
+        key = None
+        rows = []
+
+        def write_block():
+            if not rows:
+                return
+            text = io.StringIO()
+            csv.writer(text).writerows(rows)
+            data = zlib.compress(text.getvalue().encode('utf-8'), level)
+            blocks.append({
+                'station': key[0],
+                'first': rows[0][d],
+                'last': rows[-1][d],
+                'rows': len(rows),
+                'offset': f.tell(),
+                'length': len(data)
+            })
+            f.write(data)
+
+        for chunk in iter_historical_chunks(path, fields):
+            for row in chunk:
+                row_key = ('' if s is None else row[s], row[d][:7])
+                if row_key != key:
+                    write_block()
+                    key = row_key
+                    rows = []
+                rows.append(row)
+        write_block()
+
+        footer = f.tell()
+        f.write(json.dumps({'fields': list(fields),
+                            'blocks': blocks}).encode('utf-8'))
+        f.seek(len(BLOCKS_MAGIC))
+        f.write(struct.pack('<Q', footer))
+    os.replace(out_path + '.tmp', out_path)
+    return out_path
+
+
+class BlockStore:
+    """Random access to a block file written by pack_blocks."""
+
+    def __init__(self, path):
+        """Constructor
+
+        Args:
+            path (str): a .blocks file.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(BLOCKS_MAGIC)) != BLOCKS_MAGIC:
+                raise ValueError('{} is not a block file'.format(path))
+            footer = struct.unpack('<Q', f.read(8))[0]
+            f.seek(footer)
+            index = json.loads(f.read().decode('utf-8'))
+        self.fields = tuple(index['fields'])
+        self.index = index['blocks']
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def years(self):
+        """Get the years with readings.
+
+        Returns:
+            list: years, in order.
+        """
+        return sorted({int(b['first'][:4]) for b in self.index})
+
+    def blocks(self, stations=None, start=None, end=None, months=None):
+        """Find the blocks that may hold readings.
+
+        Args:
+            stations (set): station ids, or None for every station.
+            start (datetime.datetime): skip readings before this time.
+            end (datetime.datetime): skip readings at or after this time.
+            months (set): months (1-12) to keep in every year, or None for
+            every month.
+
+        Returns:
+            list: positions in self.index, in file order.
+        """
+        start_string = start.strftime('%Y-%m-%dT%H:%M:%S') if start else None
+        end_string = end.strftime('%Y-%m-%dT%H:%M:%S') if end else None
+        return [
+            i for i, b in enumerate(self.index)
+            if (stations is None or b['station'] in stations) and
+               (start_string is None or b['last'] >= start_string) and
+               (end_string is None or b['first'] < end_string) and
+               (months is None or int(b['first'][5:7]) in months)
+        ]
+
+    def read_block(self, i):
+        """Decompress a block.
+
+        Notes:
+            Recently used blocks are cached, so forecasts that keep touching
+            the same weeks only decompress them once.
+
+        Args:
+            i (int): a position in self.index.
+
+        Returns:
+            list: tuples ordered like self.fields.
+        """
+        with self._lock:
+            rows = self._cache.get(i)
+            if rows is not None:
+                self._cache.move_to_end(i)
+                return rows
+            b = self.index[i]
+            with open(self.path, 'rb') as f:
+                f.seek(b['offset'])
+                data = f.read(b['length'])
+            text = zlib.decompress(data).decode('utf-8')
+            rows = [tuple(r) for r in csv.reader(io.StringIO(text))]
+            self._cache[i] = rows
+            if len(self._cache) > BLOCK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return rows
+
+    def iter_chunks(self, fields=HISTORICAL_FIELDS, stations=None, start=None,
+                    end=None, months=None, chunk_size=CHUNK_SIZE):
+        """Stream readings from the blocks that hold them.
+
+        Args:
+            fields (tuple): the field names to keep, in order. Fields that
+            were not packed come back as blank strings.
+            stations (set): station ids to keep, or None for every station.
+            start (datetime.datetime): skip readings before this time.
+            end (datetime.datetime): skip readings at or after this time.
+            months (set): see blocks().
+            chunk_size (int): the maximum number of rows in each chunk.
+
+        Yields:
+            list: a list of tuples, one per reading, ordered like fields.
+        """
+        start_string = start.strftime('%Y-%m-%dT%H:%M:%S') if start else None
+        end_string = end.strftime('%Y-%m-%dT%H:%M:%S') if end else None
+        positions = [self.fields.index(h) if h in self.fields else None
+                     for h in fields]
+        d = self.fields.index('DATE')
+        chunk = []
+        for i in self.blocks(stations, start, end, months):
+            for row in self.read_block(i):
+                if start_string and row[d] < start_string:
+                    continue
+                if end_string and row[d] >= end_string:
+                    continue
+                chunk.append(tuple('' if p is None else row[p]
+                                   for p in positions))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+def open_block_store(path):
+    """Get the BlockStore for a block file.
+
+    Notes:
+        Stores are kept for the life of the process, so each file's index is
+        parsed once and its block cache is shared by every caller. A file
+        that has been rewritten since it was opened is opened again.
+
+    Args:
+        path (str): a .blocks file.
+
+    Returns:
+        BlockStore
+    """
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    version = (st.st_mtime_ns, st.st_size)
+    with _block_stores_lock:
+        entry = _block_stores.get(path)
+        if entry is None or entry[0] != version:
+            entry = (version, BlockStore(path))
+            _block_stores[path] = entry
+        return entry[1]
@@ -0,0 +1,338 @@
+import bisect
+import calendar
+import datetime
+import functools
+import math
+import re
+
+WEATHER_TYPES = {
+    'FG':   'fog',
+    'TS':   'thunder',
+    'PL':   'sleet',
+    'GR':   'hail',
+    'GL':   'ice sheeting',
+    'DU':   'dust',
+    'HZ':   'haze',
+    'BLSN': 'drifing snow',
+    'FC':   'funnel cloud',
+    'WIND': 'high winds',
+    'BLPY': 'blowing spray',
+    'BR':   'mist',
+    'DZ':   'drizzle',
+    'FZDZ': 'freezing drizzle',
+    'RA':   'rain',
+    'FZRA': 'freezing rain',
+    'SN':   'snow',
+    'UP':   'precipitation',
+    'MIFG': 'ground fog',
+    'FZFG': 'freezing fog'
+}
+
+# Finds weather type codes within reported groups, which combine a
+# descriptor and one or more codes, e.g. 'TSRA' or 'SHRA'. Longer codes are
+# tried first, so 'FZRA' stays whole, and unknown pairs like 'SH' are skipped.
+WEATHER_CODE_PATTERN = re.compile(
+    '|'.join(sorted(WEATHER_TYPES, key=len, reverse=True)) + '|[A-Z]{2}'
+)
+
+SKY_CONDITIONS = {
+   'CLR': 'clear sky',
+   'FEW': 'few clouds',
+   'SCT': 'scattered clouds',
+   'BKN': 'broken clouds',
+   'OVC': 'overcast'
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def weather_codes(present_weather):
+    """Decode HourlyPresentWeatherType.
+
+    Notes:
+        A station reports only a few hundred distinct strings, so decoded
+        strings are cached. Intensity signs are dropped and groups are split
+        into the codes in WEATHER_TYPES, so '+TSRA' reports {'TS', 'RA'}.
+
+    Args:
+        present_weather (str): e.g. '-RA:02 BR:1 |RA |RA'
+
+    Returns:
+        frozenset: weather type codes, e.g. {'RA', 'BR'}
+    """
+    return frozenset(
+        code
+        for group in re.findall('[A-Z]+', present_weather)
+        for code in WEATHER_CODE_PATTERN.findall(group)
+        if code in WEATHER_TYPES
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def sky_code(sky_conditions):
+    """Decode HourlySkyConditions.
+
+    Args:
+        sky_conditions (str): e.g. 'FEW:02 70 SCT:04 200 BKN:07 250'
+
+    Returns:
+        str: the code of the last cloud layer, e.g. 'BKN', or None.
+    """
+    matches = re.search('([A-Z]{3}).*$', sky_conditions)
+    if matches:
+        return matches.group(1)
+    return None
+
+
+class YearEventIndex:
+    """Bitmaps over the hours of one YearPartition's hourly grid.
+
+    Notes:
+        Each bitmap is a Python int with bit h set when hour h of the year
+        has a condition: a present weather code, a sky cover class, or a
+        temperature at or above each whole degree. Queries intersect bitmaps
+        instead of decoding readings.
+
+        Bitmaps are built from the partition's hourly grids, which only have
+        values for hours with a reading close by (see YearPartition), so
+        hours outside the data or in gaps in it never match.
+    """
+
+    def __init__(self, partition):
+        """Constructor
+
+        Args:
+            partition (YearPartition)
+        """
+        self.year = partition.year
+        self.jan1 = datetime.date(partition.year, 1, 1).toordinal()
+        self.length = (366 if calendar.isleap(self.year) else 365) * 24
+        self.weather = {}
+        self.sky = {}
+        self.temperature_at_least = {}
+        self.hours = 0
+        self._build(partition)
+        self.degrees = sorted(self.temperature_at_least)
+
+    def _build(self, partition):
+        hourly = partition.hourly
+        columns = partition.columns
+
+        def add(bitmaps, key, h):
+            bitmaps[key] = bitmaps.get(key, 0) | (1 << h)
+
+        if 'HourlyPresentWeatherType' in hourly:
+            values = columns['HourlyPresentWeatherType']
+            decoded = {}
+            for h, j in enumerate(hourly['HourlyPresentWeatherType']):
+                if j >= 0:
+                    v = values[j]
+                    if v not in decoded:
+                        decoded[v] = weather_codes(v)
+                    for code in decoded[v]:
+                        add(self.weather, code, h)
+
+        if 'HourlySkyConditions' in hourly:
+            values = columns['HourlySkyConditions']
+            decoded = {}
+            for h, j in enumerate(hourly['HourlySkyConditions']):
+                if j >= 0:
+                    v = values[j]
+                    if v not in decoded:
+                        decoded[v] = sky_code(v)
+                    if decoded[v]:
+                        add(self.sky, decoded[v], h)
+
+        if 'HourlyDryBulbTemperature' in hourly:
+            exact = {}
+            for h, t in enumerate(hourly['HourlyDryBulbTemperature']):
+                if not math.isnan(t):
+                    add(exact, int(math.floor(t)), h)
+                    self.hours |= 1 << h
+            at_least = 0
+            for degree in sorted(exact, reverse=True):
+                at_least |= exact[degree]
+                self.temperature_at_least[degree] = at_least
+
+    def month_mask(self, month):
+        """Get a bitmap of the hours in a month.
+
+        Args:
+            month (int): 1-12.
+
+        Returns:
+            int
+        """
+        start = datetime.date(self.year, month, 1).toordinal() - self.jan1
+        days = calendar.monthrange(self.year, month)[1]
+        return ((1 << (days * 24)) - 1) << (start * 24)
+
+    def hour_of_day_mask(self, hours_of_day):
+        """Get a bitmap of the hours with a given hour of day.
+
+        Args:
+            hours_of_day (iterable): hours from 0 to 23.
+
+        Returns:
+            int
+        """
+        day = 0
+        for h in hours_of_day:
+            day |= 1 << h
+        return int.from_bytes(day.to_bytes(3, 'little') * (self.length // 24),
+                              'little')
+
+    def temperature_mask(self, min_temperature=None, max_temperature=None):
+        """Get a bitmap of the hours within a temperature range.
+
+        Args:
+            min_temperature (int): in Fahrenheit, inclusive.
+            max_temperature (int): in Fahrenheit, inclusive.
+
+        Returns:
+            int
+        """
+        def at_least(t):
+            i = bisect.bisect_left(self.degrees, t)
+            if i == len(self.degrees):
+                return 0
+            return self.temperature_at_least[self.degrees[i]]
+
+        mask = self.hours
+        if min_temperature is not None:
+            mask &= at_least(int(math.ceil(min_temperature)))
+        if max_temperature is not None:
+            mask &= ~at_least(int(math.floor(max_temperature)) + 1)
+        return mask
+
+    def query(self, weather=(), sky=(), month=None, hours_of_day=None,
+              min_temperature=None, max_temperature=None):
+        """Find the hours that match every given condition.
+
+        Args:
+            weather (iterable): weather type codes that must all be present,
+            e.g. ('TS',)
+            sky (iterable): sky cover codes, any of which may be present,
+            e.g. ('BKN', 'OVC')
+            month (int): 1-12.
+            hours_of_day (iterable): hours from 0 to 23.
+            min_temperature (int): in Fahrenheit, inclusive.
+            max_temperature (int): in Fahrenheit, inclusive.
+
+        Notes:
+            Only hours with a temperature are matched.
+
+        Returns:
+            int: a bitmap of matching hours.
+        """
+        mask = self.hours
+        for code in weather:
+            mask &= self.weather.get(code, 0)
+        if sky:
+            any_sky = 0
+            for code in sky:
+                any_sky |= self.sky.get(code, 0)
+            mask &= any_sky
+        if month is not None:
+            mask &= self.month_mask(month)
+        if hours_of_day is not None:
+            mask &= self.hour_of_day_mask(hours_of_day)
+        if min_temperature is not None or max_temperature is not None:
+            mask &= self.temperature_mask(min_temperature, max_temperature)
+        return mask
+
+    def days(self, mask):
+        """Get the days that have at least one hour in a bitmap.
+
+        Args:
+            mask (int): a bitmap of hours.
+
+        Returns:
+            list: datetime.date objects.
+        """
+        days = []
+        while mask:
+            h = (mask & -mask).bit_length() - 1
+            day = h // 24
+            days.append(datetime.date.fromordinal(self.jan1 + day))
+            mask >>= (day + 1) * 24
+            mask <<= (day + 1) * 24
+        return days
+
+
+class EventIndex:
+    """Bitmap indexes over every year of historical data.
+
+    Notes:
+        Each partition's index is built once and kept on the partition, so
+        appending data only rebuilds the years that changed.
+    """
+
+    def __init__(self, historical):
+        """Constructor
+
+        Args:
+            historical (HistoricalData)
+        """
+        self.historical = historical
+        self.indexes = {}
+        for year in historical.years:
+            p = historical.partition(year)
+            if p.events is None:
+                p.events = YearEventIndex(p)
+            self.indexes[year] = p.events
+
+    def find_days(self, **conditions):
+        """Find historical days with at least one hour matching every
+        condition, e.g. find_days(weather=('TS',), month=5,
+        hours_of_day=range(12, 18)) for thunderstorm afternoons in May.
+
+        Args:
+            conditions: see YearEventIndex.query.
+
+        Returns:
+            list: datetime.date objects, in order.
+        """
+        days = []
+        for year in self.historical.years:
+            index = self.indexes[year]
+            days.extend(index.days(index.query(**conditions)))
+        return days
+
+    def find_analogs(self, temperature_min, temperature_max, weather=(),
+                     month=None, n=5):
+        """Find the historical days closest to a forecast.
+
+        Notes:
+            Days are scored by the distance between their temperature range
+            and the forecast's, plus ten degrees for each weather type that
+            the forecast has and the day does not. Only days in month, when
+            given, are considered.
+
+        Args:
+            temperature_min (int): the forecast low in Fahrenheit.
+            temperature_max (int): the forecast high in Fahrenheit.
+            weather (iterable): forecast weather type codes.
+            month (int): 1-12.
+            n (int): the number of days to return.
+
+        Returns:
+            list: the n closest datetime.date objects, closest first.
+        """
+        scored = []
+        for year in self.historical.years:
+            p = self.historical.partition(year)
+            index = self.indexes[year]
+            weather_days = [set(index.days(index.weather.get(code, 0)))
+                            for code in weather]
+            for day, count in enumerate(p.daily_count):
+                if not count:
+                    continue
+                date = datetime.date.fromordinal(index.jan1 + day)
+                if month is not None and date.month != month:
+                    continue
+                score = abs(p.daily_min[day] - temperature_min) + \
+                        abs(p.daily_max[day] - temperature_max)
+                score += 10 * sum(date not in days for days in weather_days)
+                scored.append((score, date))
+        scored.sort()
+        return [date for score, date in scored[:n]]
@@ -0,0 +1,159 @@
+import collections
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import re
+
+from .classes import Forecast
+from .snapshot import snapshots
+
+STEP_UNITS = {
+    's': 'seconds',
+    'm': 'minutes',
+    'h': 'hours',
+    'd': 'days'
+}
+
+# Station id -> snapshot, for the stations being exported. Filled in before
+# worker processes fork, so that they share the parent's snapshots; workers
+# started without fork load their own.
+_station_snapshots = {}
+
+
+def parse_step(step):
+    """Parse a step like '1h', '30m' or '1d'.
+
+    Args:
+        step (str)
+
+    Returns:
+        datetime.timedelta
+    """
+    m = re.match(r'^(\d+)([smhd])$', step)
+    if not m or not int(m.group(1)):
+        raise ValueError('invalid step: {}'.format(step))
+    return datetime.timedelta(**{STEP_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def json_default(o):
+    """Serialize objects the json module does not handle.
+
+    Args:
+        o: the object.
+
+    Returns:
+        str: datetimes and dates in ISO 8601 format.
+    """
+    if isinstance(o, (datetime.datetime, datetime.date)):
+        return o.isoformat()
+    raise TypeError('{} is not JSON serializable'.format(type(o).__name__))
+
+
+def select_fields(d, fields):
+    """Select a subset of a forecast dict.
+
+    Args:
+        d (dict): a Forecast.asdict() result.
+        fields (list): top level keys like 'hourly', or dotted paths like
+        'current_weather.temperature'. For lists of cells, the path applies to
+        every cell.
+
+    Returns:
+        dict: the selected fields, nested like d.
+    """
+    output = {}
+    for field in fields:
+        key, _, rest = field.partition('.')
+        value = d[key]
+        if not rest:
+            output[key] = value
+        elif isinstance(value, list):
+            cells = output.setdefault(key, [{} for _ in value])
+            for cell, v in zip(cells, value):
+                cell.update(select_fields(v, [rest]))
+        else:
+            output.setdefault(key, {}).update(select_fields(value, [rest]))
+    return output
+
+
+def _load_snapshots(stations):
+    for station in stations:
+        if station in _station_snapshots:
+            continue
+        if station is None:
+            _station_snapshots[None] = snapshots.current()
+        else:
+            _station_snapshots[station] = snapshots.for_station(station)
+
+
+def _forecast_line(task):
+    dt, station, fields, options = task
+    snapshot = _station_snapshots[station]
+    f = Forecast(dt, snapshot=snapshot, **options).asdict()
+    if fields:
+        f = select_fields(f, fields)
+    record = {'dt': dt}
+    if station is not None:
+        record['station'] = station
+    record.update(f)
+    return json.dumps(record, default=json_default)
+
+
+def iter_export(start, end, step, stations=None, fields=None, workers=1,
+                buffer_size=None, **options):
+    """Compute forecasts for a range of times as NDJSON lines.
+
+    Notes:
+        Forecasts are computed in a pool of worker processes. Workers are
+        forked where the platform allows, so they share the snapshots loaded
+        here; elsewhere each worker loads its own. Lines are yielded in time
+        order, then station order, and no more than buffer_size forecasts are
+        in flight or waiting to be written at once.
+
+    Args:
+        start (datetime.datetime): the first forecast time.
+        end (datetime.datetime): forecasts stop before this time.
+        step (datetime.timedelta): time between forecasts.
+        stations (list): station ids, each with a forecast per time. Defaults
+        to the current snapshot.
+        fields (list): a field subset, see select_fields.
+        workers (int): the number of worker processes.
+        buffer_size (int): defaults to four forecasts per worker.
+        options: passed through to Forecast, e.g. year or warming.
+
+    Yields:
+        str: a JSON document for each forecast, without a trailing newline.
+    """
+    stations = list(stations) if stations else [None]
+    _load_snapshots(stations)
+
+    def tasks():
+        dt = start
+        while dt < end:
+            for station in stations:
+                yield (dt, station, fields, options)
+            dt += step
+
+    if workers <= 1:
+        yield from map(_forecast_line, tasks())
+        return
+
+    buffer_size = buffer_size or workers * 4
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+    with concurrent.futures.ProcessPoolExecutor(
+        workers,
+        mp_context=context,
+        initializer=_load_snapshots,
+        initargs=(stations,)
+    ) as executor:
+        pending = collections.deque()
+        for task in tasks():
+            if len(pending) >= buffer_size:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_forecast_line, task))
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,844 @@
+import bisect
+import calendar
+import datetime
+import math
+import random
+from array import array
+
+from .data import HISTORICAL_DATA_PATH, HISTORICAL_FIELDS, \
+                  iter_historical_chunks, open_block_store
+from .events import EventIndex
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+YEAR_SELECTION_MODES = ('display', 'day', 'random')
+
+
+def parse_number(value):
+    """Parse a numeric reading from NCEI data.
+
+    Notes:
+        LCD readings are sometimes flagged with a trailing 's' (suspect) or
+        replaced with 'M' (missing) or 'T' (trace).
+
+    Args:
+        value (str): the raw reading.
+
+    Returns:
+        float: the reading, or None if it is blank or not a number.
+    """
+    try:
+        return float(value.rstrip('s'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def timestamp(dt):
+    """Get a sortable integer timestamp for a naive datetime.
+
+    Args:
+        dt (datetime.datetime)
+
+    Returns:
+        int: seconds since 1970-01-01T00:00:00.
+    """
+    return (dt.toordinal() - EPOCH_ORDINAL) * 86400 + \
+           dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def from_timestamp(t):
+    """Get the naive datetime for a timestamp.
+
+    Args:
+        t (int): seconds since 1970-01-01T00:00:00.
+
+    Returns:
+        datetime.datetime
+    """
+    return EPOCH + datetime.timedelta(seconds=t)
+
+
+def replace_year(dt, year):
+    """Move a datetime into another year, mapping February 29th onto the 28th
+    when the target year is not a leap year.
+
+    Args:
+        dt (datetime.datetime)
+        year (int)
+
+    Returns:
+        datetime.datetime
+    """
+    try:
+        return dt.replace(year=year)
+    except ValueError:
+        return dt.replace(year=year, day=28)
+
+
+def copy_array(values):
+    """Copy a typed sequence into a new array.
+
+    Args:
+        values (array): or a memoryview cast to an array typecode, like the
+        tables of a shared partition.
+
+    Returns:
+        array
+    """
+    if isinstance(values, memoryview):
+        return array(values.format, values)
+    return array(values.typecode, values)
+
+
+class YearPartition:
+    """Historical readings for a single year.
+
+    Notes:
+        Readings are stored by column, next to a sorted time index. Each field
+        also gets a forward-fill table holding, for every reading, the index of
+        the most recent non-blank value, so that a lookup never has to walk
+        backwards through the data. Daily temperature rollups are indexed by
+        day of year.
+
+        Readings land at irregular times, so fields listed in
+        hourly_interpolation are also resampled onto a grid with one entry per
+        hour of the year. 'linear' interpolates numbers between the readings
+        on either side of the hour, 'nearest' takes the closest reading and
+        'previous' the most recent one. The 'nearest' and 'previous' grids
+        store reading indexes, so categorical values are not copied. Hours
+        more than hourly_reach before a field's first reading or after its
+        last, and hours in a gap longer than hourly_max_gap that are not
+        within hourly_reach of a reading, are left at NaN or -1.
+
+        A blank reading usually means a value is missing, but for fields in
+        blank_readings it is a value of its own: a blank present weather type
+        means there was no weather to report.
+    """
+
+    summary_field = 'HourlyDryBulbTemperature'
+    daily_tables = ('daily_min', 'daily_max', 'daily_sum', 'daily_count')
+    hourly_interpolation = {
+        'DATE':                      'previous',
+        'HourlyDewPointTemperature': 'linear',
+        'HourlyDryBulbTemperature':  'linear',
+        'HourlyPresentWeatherType':  'nearest',
+        'HourlyRelativeHumidity':    'linear',
+        'HourlySkyConditions':       'nearest',
+        'HourlyVisibility':          'nearest',
+        'HourlyWindDirection':       'nearest',
+        'HourlyWindSpeed':           'nearest'
+    }
+    blank_readings = frozenset(['HourlyPresentWeatherType'])
+    # Seconds between readings that hourly grids interpolate across, and
+    # seconds from a reading that count as covering an hour otherwise.
+    hourly_max_gap = 3 * 3600
+    hourly_reach = 3600
+
+    def __init__(self, year, fields, times, columns, filled=None, daily=None,
+                 hourly=None, length=None):
+        """Constructor
+
+        Args:
+            year (int)
+            fields (tuple): field names.
+            times (array): sorted timestamps, one per reading.
+            columns (dict): field name -> sequence of raw string values.
+            filled (dict): prebuilt forward-fill tables, field name ->
+            sequence of indexes. Built from columns if not given.
+            daily (dict): prebuilt daily rollups, named like daily_tables.
+            Built from columns if not given.
+            hourly (dict): prebuilt hourly grids, field name -> sequence.
+            Built from columns if not given.
+            length (int): the number of readings in this partition. The
+            storage may be longer when a newer partition has appended to it.
+        """
+        self.year = year
+        self.fields = tuple(fields)
+        self.times = times
+        self.columns = columns
+        self.length = len(times) if length is None else length
+        self._jan1 = timestamp(datetime.datetime(year, 1, 1))
+        self._month_bounds = None
+        self._monthly_means = None
+        # This year's YearEventIndex, built the first time it is queried.
+        self.events = None
+        if filled is None:
+            filled = {f: self._build_filled(columns[f]) for f in self.fields}
+        self.filled = filled
+        if daily is None:
+            self._build_daily()
+        else:
+            for name in self.daily_tables:
+                setattr(self, name, daily[name])
+        if hourly is None:
+            self.hourly = {f: self._new_hourly_table(f) for f in self.fields
+                           if f in self.hourly_interpolation}
+            for f in self.hourly:
+                self._fill_hourly(f)
+        else:
+            self.hourly = hourly
+
+    @classmethod
+    def from_rows(cls, year, fields, rows):
+        """Build a partition from projected rows.
+
+        Args:
+            year (int)
+            fields (tuple): field names, including 'DATE'.
+            rows (list): tuples ordered like fields.
+
+        Returns:
+            YearPartition
+        """
+        d = fields.index('DATE')
+        rows = sorted(rows, key=lambda r: r[d])
+        times = array('q', (
+            timestamp(datetime.datetime.strptime(r[d], '%Y-%m-%dT%H:%M:%S'))
+            for r in rows
+        ))
+        columns = {f: [r[i] for r in rows] for i, f in enumerate(fields)}
+        return cls(year, fields, times, columns)
+
+    def __len__(self):
+        return self.length
+
+    def appended(self, new_times, rows):
+        """Get a partition with new readings added at the end.
+
+        Notes:
+            Columns are append-only, so the new partition extends this one's
+            storage in place and this partition keeps seeing only its own
+            readings. Forward-fill tables are extended, and daily rollups and
+            hourly grids updated, for the new readings only. Storage that is
+            read-only, or that another partition has already extended, is
+            copied first.
+
+        Args:
+            new_times (list): sorted timestamps, none earlier than the last
+            reading in this partition.
+            rows (list): tuples ordered like self.fields.
+
+        Returns:
+            YearPartition
+        """
+        n = self.length
+        if isinstance(self.times, array) and len(self.times) == n:
+            times = self.times
+            columns = self.columns
+            filled = self.filled
+        else:
+            times = array('q', self.times[:n])
+            columns = {f: list(self.columns[f][:n]) for f in self.fields}
+            filled = {f: array('q', self.filled[f][:n]) for f in self.fields}
+
+        # Hourly grids are recomputed from each field's last reading onwards.
+        last_readings = {
+            f: (n - 1 if f in self.blank_readings else
+                max(filled[f][n - 1], 0)) if n else 0
+            for f in self.hourly
+        }
+
+        times.extend(new_times)
+        for k, f in enumerate(self.fields):
+            values = columns[f]
+            last = filled[f][n - 1] if n else -1
+            for i, row in enumerate(rows, n):
+                values.append(row[k])
+                if row[k]:
+                    last = i
+                filled[f].append(last)
+
+        partition = YearPartition(
+            self.year,
+            self.fields,
+            times,
+            columns,
+            filled=filled,
+            daily={name: copy_array(getattr(self, name))
+                   for name in self.daily_tables},
+            hourly={f: copy_array(self.hourly[f]) for f in self.hourly},
+            length=n + len(rows)
+        )
+        for f, a in last_readings.items():
+            partition._fill_hourly(f, a)
+        if self.summary_field in self.fields:
+            start = timestamp(datetime.datetime(self.year, 1, 1))
+            k = self.fields.index(self.summary_field)
+            for t, row in zip(new_times, rows):
+                partition._add_to_daily((t - start) // 86400,
+                                        parse_number(row[k]))
+        return partition
+
+    def _build_filled(self, values):
+        filled = array('q')
+        last = -1
+        for i, v in enumerate(values):
+            if v:
+                last = i
+            filled.append(last)
+        return filled
+
+    def _new_hourly_table(self, field):
+        hours = (366 if calendar.isleap(self.year) else 365) * 24
+        if self.hourly_interpolation[field] == 'linear':
+            return array('d', [float('nan')] * hours)
+        return array('q', [-1] * hours)
+
+    def _fill_hourly(self, field, a=0):
+        """Compute a field's hourly grid, from reading a onwards."""
+        n = self.length
+        if a >= n:
+            return
+        mode = self.hourly_interpolation[field]
+        table = self.hourly[field]
+        values = self.columns[field]
+        times = self.times
+        jan1 = self._jan1
+        if mode == 'linear':
+            readings = []
+            for i in range(a, n):
+                v = parse_number(values[i])
+                if v is not None:
+                    readings.append((times[i], v))
+        elif field in self.blank_readings:
+            readings = [(times[i], i) for i in range(a, n)]
+        else:
+            readings = [(times[i], i) for i in range(a, n) if values[i]]
+        if not readings:
+            return
+
+        # Hours before reading a keep their values, except within reach of
+        # the first reading of the year.
+        reach = self.hourly_reach
+        first = readings[0][0] - (reach if a == 0 else 0)
+        first_hour = max(-((jan1 - first) // 3600), 0)
+        last_hour = min((readings[-1][0] + reach - jan1) // 3600,
+                        len(table) - 1)
+        missing = float('nan') if mode == 'linear' else -1
+        j = 0
+        for h in range(first_hour, last_hour + 1):
+            t = jan1 + h * 3600
+            while j < len(readings) and readings[j][0] <= t:
+                j += 1
+            following = readings[j] if j < len(readings) else None
+            if j == 0:
+                if mode != 'previous':
+                    table[h] = following[1]
+                continue
+            previous = readings[j - 1]
+            bridged = following is not None and \
+                following[0] - previous[0] <= self.hourly_max_gap
+            if mode == 'linear' and bridged:
+                table[h] = previous[1] + (following[1] - previous[1]) * \
+                    (t - previous[0]) / (following[0] - previous[0])
+                continue
+            if mode != 'previous' and following is not None and \
+                    following[0] - t < t - previous[0]:
+                nearest = following
+            else:
+                nearest = previous
+            if bridged or abs(nearest[0] - t) <= reach:
+                table[h] = nearest[1]
+            else:
+                table[h] = missing
+
+    def _build_daily(self):
+        days = 366 if calendar.isleap(self.year) else 365
+        self.daily_min = array('d', [float('nan')] * days)
+        self.daily_max = array('d', [float('nan')] * days)
+        self.daily_sum = array('d', [0.0] * days)
+        self.daily_count = array('q', [0] * days)
+        start = timestamp(datetime.datetime(self.year, 1, 1))
+        values = self.columns.get(self.summary_field, ())
+        for t, v in zip(self.times, values):
+            self._add_to_daily((t - start) // 86400, parse_number(v))
+
+    def _add_to_daily(self, day, v):
+        if v is None:
+            return
+        if not self.daily_count[day] or v < self.daily_min[day]:
+            self.daily_min[day] = v
+        if not self.daily_count[day] or v > self.daily_max[day]:
+            self.daily_max[day] = v
+        self.daily_sum[day] += v
+        self.daily_count[day] += 1
+
+    def month_bounds(self):
+        """Get the index of the first reading of each month.
+
+        Returns:
+            array: 13 indexes; readings for month m (1-12) fall in
+            range(bounds[m - 1], bounds[m]).
+        """
+        if self._month_bounds is None:
+            self._month_bounds = array('q', (
+                bisect.bisect_left(
+                    self.times,
+                    timestamp(datetime.datetime(self.year + m // 12,
+                                                m % 12 + 1, 1)),
+                    0,
+                    self.length
+                ) for m in range(13)
+            ))
+        return self._month_bounds
+
+    def monthly_means(self):
+        """Get the mean daily temperature of each month.
+
+        Returns:
+            array: 12 means in Fahrenheit, NaN for months without readings.
+        """
+        if self._monthly_means is None:
+            sums = [0.0] * 12
+            counts = [0] * 12
+            jan1 = datetime.date(self.year, 1, 1).toordinal()
+            for day, count in enumerate(self.daily_count):
+                if count:
+                    m = datetime.date.fromordinal(jan1 + day).month - 1
+                    sums[m] += self.daily_sum[day] / count
+                    counts[m] += 1
+            self._monthly_means = array('d', (
+                s / c if c else float('nan') for s, c in zip(sums, counts)
+            ))
+        return self._monthly_means
+
+    def closest_past_index(self, dt):
+        """Find the most recent reading before a given time of year.
+
+        Args:
+            dt (datetime.datetime): any year; only the month, day and time are
+            used.
+
+        Returns:
+            int: an index into this partition. Times before the first reading
+            of the year map to the first reading.
+        """
+        t = timestamp(replace_year(dt, self.year))
+        return max(bisect.bisect_left(self.times, t, 0, self.length) - 1, 0)
+
+    def value(self, field, i):
+        """Get the most recent non-blank value of a field at or before a
+        reading. For fields in blank_readings, get the reading's own value.
+
+        Args:
+            field (str): the field name.
+            i (int): an index into this partition.
+
+        Returns:
+            str: the data, or '' if there is none.
+        """
+        if field in self.blank_readings:
+            return self.columns[field][i]
+        j = self.filled[field][i]
+        if j < 0:
+            return ''
+        return self.columns[field][j]
+
+    def hour_index(self, dt):
+        """Get the position of an hour in this partition's hourly grids.
+
+        Args:
+            dt (datetime.datetime): any year; only the month, day and hour are
+            used.
+
+        Returns:
+            int
+        """
+        return (timestamp(replace_year(dt, self.year)) - self._jan1) // 3600
+
+    def hourly_value(self, field, dt):
+        """Get the value of a field for an hour from the hourly grid.
+
+        Notes:
+            Fields without a grid, and hours the grid has no value for, fall
+            back to the most recent reading.
+
+        Args:
+            field (str): the field name.
+            dt (datetime.datetime): any year; only the month, day and hour are
+            used.
+
+        Returns:
+            str: the data, or '' if there is none.
+        """
+        table = self.hourly.get(field)
+        if table is not None:
+            v = table[self.hour_index(dt)]
+            if self.hourly_interpolation[field] == 'linear':
+                if not math.isnan(v):
+                    return str(int(round(v)))
+            elif v >= 0:
+                return self.columns[field][v]
+        return self.value(field, self.closest_past_index(dt))
+
+    def column(self, field, start, stop):
+        """Get a run of forward-filled readings as numbers.
+
+        Args:
+            field (str): the field name.
+            start (int): the first index.
+            stop (int): one past the last index.
+
+        Returns:
+            array: floats, NaN where there is no reading.
+        """
+        nan = float('nan')
+        values = self.columns[field]
+        filled = self.filled[field]
+        numbers = array('d')
+        for i in range(start, stop):
+            j = filled[i]
+            n = parse_number(values[j]) if j >= 0 else None
+            numbers.append(nan if n is None else n)
+        return numbers
+
+    def hourly_numbers(self, field, dts):
+        """Get a linear field's values for a run of hours from the hourly
+        grid.
+
+        Notes:
+            Unlike hourly_value, hours without a value in the grid are NaN
+            rather than falling back to the most recent reading.
+
+        Args:
+            field (str): the field name.
+            dts (list): datetime.datetime objects, in any year.
+
+        Returns:
+            array: floats, one per hour.
+        """
+        table = self.hourly.get(field)
+        if table is None:
+            return array('d', [float('nan')] * len(dts))
+        return array('d', [table[self.hour_index(dt)] for dt in dts])
+
+    def daily_summary(self, dt, summary_type):
+        """Get a temperature summary for a day.
+
+        Args:
+            dt (datetime.datetime): any year; only the month and day are used.
+            summary_type (str): one of 'min', 'max', 'mean'
+
+        Returns:
+            int: the temperature summary in Fahrenheit.
+        """
+        day = replace_year(dt, self.year).timetuple().tm_yday - 1
+        if not self.daily_count[day]:
+            raise ValueError('no readings for {}'.format(dt.strftime('%m-%d')))
+        if summary_type == 'min':
+            return int(self.daily_min[day])
+        elif summary_type == 'max':
+            return int(self.daily_max[day])
+        elif summary_type == 'mean':
+            return int(self.daily_sum[day] / self.daily_count[day])
+        else:
+            raise ValueError
+
+
+class HistoricalData:
+    """Historical readings, partitioned by year.
+
+    Notes:
+        Each year is indexed independently, so choosing a different source
+        year is a dictionary lookup and adding years does not slow down
+        lookups within a year.
+    """
+
+    def __init__(self, partitions):
+        """Constructor
+
+        Args:
+            partitions (dict): year -> YearPartition
+        """
+        self.partitions = partitions
+        self.years = sorted(partitions)
+        self._events = None
+        # (month, day) -> the years with readings that day, built the first
+        # time years are sampled.
+        self._years_by_day = None
+        # The mapped file backing this data, for data attached from a
+        # shared segment.
+        self.segment = None
+
+    @classmethod
+    def load(cls, path=HISTORICAL_DATA_PATH, fields=HISTORICAL_FIELDS,
+             stations=None, start=None, end=None):
+        """Load historical data from an NCEI file.
+
+        Args:
+            path (str): a .csv or .csv.gz NCEI file, or a .blocks file.
+            fields (tuple): the field names to keep; must include 'DATE'.
+            stations (set): station ids to keep, or None for every station.
+            start (datetime.datetime): skip readings before this time.
+            end (datetime.datetime): skip readings at or after this time.
+
+        Returns:
+            HistoricalData
+        """
+        return cls._from_chunks(
+            iter_historical_chunks(path, fields, stations, start, end),
+            fields
+        )
+
+    @classmethod
+    def load_window(cls, path, dt, days=8, fields=HISTORICAL_FIELDS,
+                    stations=None):
+        """Load the readings a forecast needs from a block file.
+
+        Notes:
+            A forecast reads the same few days of the year from whichever
+            historical years it draws on, so only the blocks for the months
+            between the day before dt and days after it are decompressed,
+            in every year.
+
+        Args:
+            path (str): a .blocks file written by pack_blocks.
+            dt (datetime.datetime): the forecast time.
+            days (int): the number of days the forecast covers.
+            fields (tuple): the field names to keep; must include 'DATE'.
+            stations (set): station ids to keep, or None for every station.
+
+        Returns:
+            HistoricalData
+        """
+        months = {(dt + datetime.timedelta(days=d)).month
+                  for d in range(-1, days + 1)}
+        return cls._from_chunks(
+            open_block_store(path).iter_chunks(fields, stations,
+                                               months=months),
+            fields
+        )
+
+    @classmethod
+    def _from_chunks(cls, chunks, fields):
+        d = fields.index('DATE')
+        rows_by_year = {}
+        for chunk in chunks:
+            for row in chunk:
+                rows_by_year.setdefault(int(row[d][:4]), []).append(row)
+        return cls({
+            year: YearPartition.from_rows(year, fields, rows_by_year.pop(year))
+            for year in sorted(rows_by_year)
+        })
+
+    def new_readings(self, rows, fields=HISTORICAL_FIELDS):
+        """Validate readings to be appended.
+
+        Notes:
+            Readings must be in time order and no earlier than the last
+            loaded reading. Exact duplicates, within rows or of readings that
+            are already loaded, are dropped so that overlapping downloads can
+            be appended safely.
+
+        Args:
+            rows (list): tuples ordered like fields.
+            fields (tuple): the field names, including 'DATE'.
+
+        Raises:
+            ValueError: when a reading is out of order or the wrong shape.
+
+        Returns:
+            list: (timestamp, row) tuples for the readings to append.
+        """
+        d = fields.index('DATE')
+        previous_t = None
+        previous_rows = set()
+        if self.years:
+            p = self.partitions[self.years[-1]]
+            if p.fields != tuple(fields):
+                raise ValueError('readings have different fields')
+            previous_t = p.times[len(p) - 1]
+            previous_rows = self._rows_at(previous_t)
+
+        readings = []
+        for row in rows:
+            row = tuple(row)
+            if len(row) != len(fields):
+                raise ValueError('expected {} fields, got {}'.format(
+                    len(fields), len(row)))
+            t = timestamp(
+                datetime.datetime.strptime(row[d], '%Y-%m-%dT%H:%M:%S')
+            )
+            if previous_t is not None and t < previous_t:
+                if row in self._rows_at(t):
+                    continue
+                raise ValueError('reading at {} is out of order'.format(
+                    row[d]))
+            if t != previous_t:
+                previous_t = t
+                previous_rows = set()
+            elif row in previous_rows:
+                continue
+            previous_rows.add(row)
+            readings.append((t, row))
+        return readings
+
+    def _rows_at(self, t):
+        """Get the loaded readings at a timestamp, as a set of tuples."""
+        p = self.partitions.get(from_timestamp(t).year)
+        if p is None:
+            return set()
+        rows = set()
+        i = bisect.bisect_left(p.times, t, 0, len(p))
+        while i < len(p) and p.times[i] == t:
+            rows.add(tuple(p.columns[f][i] for f in p.fields))
+            i += 1
+        return rows
+
+    def appended(self, rows, fields=HISTORICAL_FIELDS):
+        """Get historical data with new readings added at the end.
+
+        Notes:
+            Only partitions for years that get new readings are replaced, and
+            the work done is proportional to the number of new readings. This
+            object is left unchanged.
+
+        Args:
+            rows (list): tuples ordered like fields, in time order.
+            fields (tuple): the field names, including 'DATE'.
+
+        Raises:
+            ValueError: see new_readings.
+
+        Returns:
+            HistoricalData
+        """
+        by_year = {}
+        for t, row in self.new_readings(rows, fields):
+            year = from_timestamp(t).year
+            times, year_rows = by_year.setdefault(year, ([], []))
+            times.append(t)
+            year_rows.append(row)
+
+        partitions = dict(self.partitions)
+        for year, (times, year_rows) in sorted(by_year.items()):
+            if year in partitions:
+                partitions[year] = partitions[year].appended(times, year_rows)
+            else:
+                partitions[year] = YearPartition(
+                    year,
+                    fields,
+                    array('q', times),
+                    {f: [r[k] for r in year_rows]
+                     for k, f in enumerate(fields)}
+                )
+        return HistoricalData(partitions)
+
+    def events(self):
+        """Get the bitmap index of weather events over every year.
+
+        Returns:
+            EventIndex
+        """
+        if self._events is None:
+            self._events = EventIndex(self)
+        return self._events
+
+    def partition(self, year):
+        """Get the readings for a year.
+
+        Args:
+            year (int)
+
+        Returns:
+            YearPartition
+        """
+        return self.partitions[year]
+
+    def years_by_day(self):
+        """Get the years with readings on each day of the year.
+
+        Notes:
+            February 29th maps onto the 28th in years that are not leap
+            years, like replace_year.
+
+        Returns:
+            dict: (month, day) -> a tuple of years, in order.
+        """
+        if self._years_by_day is None:
+            by_day = {}
+            for year in self.years:
+                p = self.partitions[year]
+                jan1 = datetime.date(year, 1, 1).toordinal()
+                for day, count in enumerate(p.daily_count):
+                    if count:
+                        date = datetime.date.fromordinal(jan1 + day)
+                        by_day.setdefault((date.month, date.day),
+                                          set()).add(year)
+                        if date.month == 2 and date.day == 28 and \
+                                not calendar.isleap(year):
+                            by_day.setdefault((2, 29), set()).add(year)
+            self._years_by_day = {k: tuple(sorted(v))
+                                  for k, v in by_day.items()}
+        return self._years_by_day
+
+    def year_sampler(self, mode='display', year=None, seed=None, dt=None,
+                     days=7):
+        """Get a function that picks a historical year for each forecast
+        cell.
+
+        Notes:
+            Only years with readings for the days being forecast are picked,
+            so partial years are skipped where they have gaps. In 'display'
+            mode that is every day of the forecast window; otherwise it is the
+            day of each cell.
+
+        Args:
+            mode (str): 'display' uses one year for the whole forecast, 'day'
+            picks a year for each calendar day, and 'random' picks a year for
+            every cell.
+            year (int): a fixed year to use, overriding mode.
+            seed: a seed for repeatable choices.
+            dt (datetime.datetime): the start of the forecast window. Needed
+            for 'display' mode to check that years cover the window.
+            days (int): the number of days in the forecast window.
+
+        Raises:
+            ValueError: if no year has readings for the days asked for.
+
+        Returns:
+            function: takes a datetime.datetime and returns a year.
+        """
+        if mode not in YEAR_SELECTION_MODES:
+            raise ValueError('unknown year selection mode: {}'.format(mode))
+        if year is not None:
+            if year not in self.partitions:
+                raise KeyError(year)
+            return lambda dt: year
+
+        by_day = self.years_by_day()
+
+        def covering(dt, days=1):
+            years = by_day.get((dt.month, dt.day), ())
+            if days > 1:
+                years = set(years)
+                for d in range(1, days):
+                    day = dt + datetime.timedelta(days=d)
+                    years.intersection_update(by_day.get((day.month, day.day),
+                                                         ()))
+                years = sorted(years)
+            if not years:
+                window = dt.strftime('%m-%d')
+                if days > 1:
+                    last = dt + datetime.timedelta(days=days - 1)
+                    window += ' to ' + last.strftime('%m-%d')
+                raise ValueError(
+                    'no historical year has readings for ' + window
+                )
+            return years
+
+        if seed is None:
+            # Days still need the same year in every cell of a forecast.
+            seed = random.getrandbits(64)
+        if mode == 'display':
+            years = covering(dt, days) if dt is not None else self.years
+            chosen = random.Random(seed).choice(years)
+            return lambda dt: chosen
+        elif mode == 'day':
+            return lambda dt: random.Random(
+                '{}:{}'.format(seed, dt.date().toordinal())
+            ).choice(covering(dt))
+        else:
+            rng = random.Random(seed)
+            return lambda dt: rng.choice(covering(dt))
@@ -0,0 +1,172 @@
+import functools
+import hashlib
+import os
+
+SPRITE_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    '..',
+    'static',
+    'icons.svg'
+)
+
+# Shapes that icons are composed from, drawn on a 64x64 grid.
+SUN = (
+    '<circle cx="32" cy="32" r="11"/>'
+    '<path d="M32 6v8M32 50v8M6 32h8M50 32h8M13.6 13.6l5.7 5.7M44.7 44.7'
+    'l5.7 5.7M13.6 50.4l5.7-5.7M44.7 19.3l5.7-5.7"/>'
+)
+SMALL_SUN = (
+    '<circle cx="22" cy="22" r="8"/>'
+    '<path d="M22 4v5M22 35v5M4 22h5M35 22h5M9.3 9.3l3.5 3.5M31.2 31.2'
+    'l3.5 3.5M9.3 34.7l3.5-3.5M31.2 12.8l3.5-3.5"/>'
+)
+CLOUD = (
+    '<path d="M20 48h26a10 10 0 0 0 0-20 14 14 0 0 0-26.6-4.5'
+    'A12 12 0 0 0 20 48z" fill="#fff"/>'
+)
+LOW_CLOUD = (
+    '<path d="M20 38h26a10 10 0 0 0 0-20 14 14 0 0 0-26.6-4.5'
+    'A12 12 0 0 0 20 38z" fill="#fff"/>'
+)
+BACK_CLOUD = '<path d="M30 34h20a8 8 0 0 0 0-16 11 11 0 0 0-21-3.5"/>'
+FOG = '<path d="M10 26h44M6 34h52M10 42h44M14 50h36"/>'
+
+ICONS = {
+    'clear':            SUN,
+    'few-clouds':       SMALL_SUN + '<path d="M30 52h18a7 7 0 0 0 0-14 '
+                        '10 10 0 0 0-19 1A7 7 0 0 0 30 52z" fill="#fff"/>',
+    'scattered-clouds': SMALL_SUN + CLOUD,
+    'broken-clouds':    BACK_CLOUD + CLOUD,
+    'overcast':         CLOUD.replace('fill="#fff"', 'fill="#ccc"'),
+    'fog':              FOG,
+    'haze':             SUN.replace('r="11"', 'r="8"') + FOG,
+    'drizzle':          LOW_CLOUD + '<path d="M24 46v3M34 46v3M44 46v3'
+                        'M29 54v3M39 54v3"/>',
+    'rain':             LOW_CLOUD + '<path d="M24 44l-3 8M34 44l-3 8'
+                        'M44 44l-3 8M29 52l-3 8M39 52l-3 8"/>',
+    'sleet':            LOW_CLOUD + '<path d="M24 44l-3 8M44 44l-3 8'
+                        'M34 52l-3 8"/><g fill="currentColor">'
+                        '<circle cx="33" cy="47" r="1.5"/>'
+                        '<circle cx="23" cy="57" r="1.5"/>'
+                        '<circle cx="43" cy="57" r="1.5"/></g>',
+    'snow':             LOW_CLOUD + '<g fill="currentColor">'
+                        '<circle cx="24" cy="46" r="1.5"/>'
+                        '<circle cx="34" cy="46" r="1.5"/>'
+                        '<circle cx="44" cy="46" r="1.5"/>'
+                        '<circle cx="29" cy="55" r="1.5"/>'
+                        '<circle cx="39" cy="55" r="1.5"/></g>',
+    'hail':             LOW_CLOUD + '<g fill="currentColor">'
+                        '<circle cx="24" cy="47" r="3"/>'
+                        '<circle cx="38" cy="47" r="3"/>'
+                        '<circle cx="31" cy="56" r="3"/></g>',
+    'thunder':          LOW_CLOUD + '<path d="M34 40l-8 12h8l-4 10 12-14'
+                        'h-8l4-8z" fill="#fd0"/>',
+    'wind':             '<path d="M6 24h32a6 6 0 1 0-6-6M6 34h44a7 7 0 1 1'
+                        '-7 7M6 44h22"/>',
+    'funnel-cloud':     LOW_CLOUD + '<path d="M20 40h26M24 46h18M28 52h10'
+                        'M31 58h4"/>'
+}
+
+SKY_ICONS = {
+    'CLR': 'clear',
+    'FEW': 'few-clouds',
+    'SCT': 'scattered-clouds',
+    'BKN': 'broken-clouds',
+    'OVC': 'overcast'
+}
+
+# Present weather codes, most important first. The first one reported picks
+# the icon; see events.weather_codes for how combined groups like 'TSRA' are
+# split.
+WEATHER_ICONS = (
+    ('FC',   'funnel-cloud'),
+    ('TS',   'thunder'),
+    ('GR',   'hail'),
+    ('FZRA', 'sleet'),
+    ('FZDZ', 'sleet'),
+    ('PL',   'sleet'),
+    ('GL',   'sleet'),
+    ('SN',   'snow'),
+    ('BLSN', 'snow'),
+    ('RA',   'rain'),
+    ('UP',   'rain'),
+    ('DZ',   'drizzle'),
+    ('FG',   'fog'),
+    ('FZFG', 'fog'),
+    ('MIFG', 'fog'),
+    ('BR',   'fog'),
+    ('HZ',   'haze'),
+    ('DU',   'haze'),
+    ('WIND', 'wind'),
+    ('BLPY', 'wind')
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def icon_for(sky_code, weather_codes):
+    """Pick the icon for decoded weather readings.
+
+    Args:
+        sky_code (str): e.g. 'BKN', or None. See events.sky_code.
+        weather_codes (frozenset): e.g. {'RA', 'BR'}. See
+        events.weather_codes.
+
+    Returns:
+        str: a key of ICONS, e.g. 'rain'.
+    """
+    for code, icon in WEATHER_ICONS:
+        if code in weather_codes:
+            return icon
+    return SKY_ICONS.get(sky_code, 'clear')
+
+
+def build_sprite():
+    """Build an SVG sprite with a symbol for each icon.
+
+    Notes:
+        Pages reference a symbol with <use href="icons.svg#icon-rain"/>, so
+        every icon comes from one cached file. Icons are drawn in
+        currentColor and follow the color of the element they are used in.
+
+    Returns:
+        str: the SVG document.
+    """
+    # Styles go on each symbol: a <use> element only copies the symbol, not
+    # the document it came from.
+    symbols = ''.join(
+        '<symbol id="icon-{}" viewBox="0 0 64 64" fill="none" '
+        'stroke="currentColor" stroke-width="3" stroke-linecap="round" '
+        'stroke-linejoin="round">{}</symbol>\n'.format(name, ICONS[name])
+        for name in sorted(ICONS)
+    )
+    return '<svg xmlns="http://www.w3.org/2000/svg">\n' + symbols + '</svg>\n'
+
+
+def write_sprite(path=SPRITE_PATH):
+    """Write the SVG sprite.
+
+    Args:
+        path (str)
+
+    Returns:
+        str: the path.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        f.write(build_sprite())
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def sprite_version(path=SPRITE_PATH):
+    """Get a version string that changes whenever the sprite does, for
+    cache busting URLs.
+
+    Args:
+        path (str)
+
+    Returns:
+        str: the first 12 hex digits of the sprite's SHA-1.
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
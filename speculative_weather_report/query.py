@@ -0,0 +1,170 @@
+import bisect
+import csv
+import json
+import math
+
+from .historical import from_timestamp, parse_number, timestamp
+
+PERIODS = ('hour', 'day', 'month')
+
+
+def percentile(values, p):
+    """Get a percentile of sorted values, interpolating between readings.
+
+    Args:
+        values (list): sorted numbers.
+        p (float): the percentile, from 0 to 100.
+
+    Returns:
+        float
+    """
+    k = (len(values) - 1) * p / 100.0
+    f = math.floor(k)
+    c = math.ceil(k)
+    if f == c:
+        return values[int(k)]
+    return values[f] * (c - k) + values[c] * (k - f)
+
+
+def aggregate(values, aggregates):
+    """Summarize a list of numbers.
+
+    Args:
+        values (list): numbers.
+        aggregates (list): 'min', 'mean', 'max', 'count' or percentiles like
+        'p90'.
+
+    Returns:
+        dict: aggregate name -> value, None when there are no values.
+    """
+    if not values:
+        return {a: 0 if a == 'count' else None for a in aggregates}
+    values = sorted(values)
+    output = {}
+    for a in aggregates:
+        if a == 'min':
+            output[a] = values[0]
+        elif a == 'max':
+            output[a] = values[-1]
+        elif a == 'mean':
+            output[a] = sum(values) / len(values)
+        elif a == 'count':
+            output[a] = len(values)
+        elif a.startswith('p'):
+            output[a] = percentile(values, float(a[1:]))
+        else:
+            raise ValueError('unknown aggregate: {}'.format(a))
+    return output
+
+
+def _index_range(partition, start, end):
+    n = len(partition)
+    lo = 0 if start is None else \
+        bisect.bisect_left(partition.times, timestamp(start), 0, n)
+    hi = n if end is None else \
+        bisect.bisect_left(partition.times, timestamp(end), 0, n)
+    return lo, hi
+
+
+def _period_bounds(partition, period, lo, hi):
+    """Split a run of readings into hours, days or months."""
+    if period == 'month':
+        bounds = partition.month_bounds()
+        for m in range(12):
+            a, b = max(bounds[m], lo), min(bounds[m + 1], hi)
+            if a < b:
+                yield partition.times[a], a, b
+        return
+    size = 3600 if period == 'hour' else 86400
+    times = partition.times
+    a = lo
+    while a < hi:
+        bucket = times[a] - times[a] % size
+        b = bisect.bisect_left(times, bucket + size, a, hi)
+        yield bucket, a, b
+        a = b
+
+
+def query_field(historical, field, start=None, end=None, fill=False,
+                period=None, aggregates=('min', 'mean', 'max')):
+    """Query one field of historical data over a time range.
+
+    Notes:
+        Each year's readings are found by binary search on its time index, so
+        a query only touches the readings it returns. Resampled queries are
+        bucketed by hour, day or month and only consider numeric readings.
+
+    Args:
+        historical (HistoricalData)
+        field (str): the field name.
+        start (datetime.datetime): the first time to include.
+        end (datetime.datetime): stop before this time.
+        fill (bool): replace blank readings with the most recent value.
+        period (str): 'hour', 'day' or 'month' to resample, or None for
+        individual readings.
+        aggregates (list): see aggregate.
+
+    Yields:
+        dict: {'dt': ..., field: value} for each reading, or
+        {'dt': ..., 'min': ..., ...} for each period.
+    """
+    if period is not None and period not in PERIODS:
+        raise ValueError('unknown period: {}'.format(period))
+    for year in historical.years:
+        if (start is not None and year < start.year) or \
+           (end is not None and year > end.year):
+            continue
+        partition = historical.partition(year)
+        if field not in partition.columns:
+            raise KeyError(field)
+        lo, hi = _index_range(partition, start, end)
+        if period is None:
+            values = partition.columns[field]
+            for i in range(lo, hi):
+                yield {
+                    'dt': from_timestamp(partition.times[i]),
+                    field: partition.value(field, i) if fill else values[i]
+                }
+        else:
+            for bucket, a, b in _period_bounds(partition, period, lo, hi):
+                dt = from_timestamp(bucket)
+                if period == 'month':
+                    dt = dt.replace(day=1, hour=0, minute=0, second=0)
+                if fill:
+                    values = [v for v in partition.column(field, a, b)
+                              if not math.isnan(v)]
+                else:
+                    values = [n for n in map(parse_number,
+                                             partition.columns[field][a:b])
+                              if n is not None]
+                row = {'dt': dt}
+                row.update(aggregate(values, aggregates))
+                yield row
+
+
+def write_csv(rows, fp):
+    """Write query results as CSV.
+
+    Args:
+        rows (iterator): dicts from query_field.
+        fp (file): the output.
+    """
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(fp, fieldnames=list(row))
+            writer.writeheader()
+        row['dt'] = row['dt'].isoformat()
+        writer.writerow(row)
+
+
+def write_json(rows, fp):
+    """Write query results as newline delimited JSON.
+
+    Args:
+        rows (iterator): dicts from query_field.
+        fp (file): the output.
+    """
+    for row in rows:
+        row['dt'] = row['dt'].isoformat()
+        fp.write(json.dumps(row) + '\n')
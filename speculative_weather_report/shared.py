@@ -0,0 +1,191 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from .historical import HistoricalData, YearPartition
+
+MAGIC = b'SWRSHM01'
+
+# Set by the process that writes a shared segment, so that worker processes
+# forked from it know where to attach.
+SHARED_DATA_ENV = 'SPECULATIVE_WEATHER_SHARED_DATA'
+
+
+def default_shared_path():
+    """Get a new, unique path for a shared segment, in memory-backed /dev/shm
+    when it is available.
+
+    Returns:
+        str
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else \
+                tempfile.gettempdir()
+    fd, path = tempfile.mkstemp(suffix='.bin',
+                                prefix='speculative_weather_report-',
+                                dir=directory)
+    os.close(fd)
+    return path
+
+
+class PackedStrings:
+    """A read-only sequence of strings stored as one UTF-8 buffer and an
+    array of offsets into it.
+    """
+
+    def __init__(self, offsets, blob):
+        """Constructor
+
+        Args:
+            offsets (memoryview): len(self) + 1 byte offsets.
+            blob (memoryview): the encoded strings, back to back.
+        """
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _SegmentWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        """Write bytes at the next 8 byte boundary.
+
+        Returns:
+            list: [offset, length] of the written bytes.
+        """
+        offset = self.f.tell()
+        if offset % 8:
+            self.f.write(b'\0' * (8 - offset % 8))
+            offset = self.f.tell()
+        self.f.write(data)
+        return [offset, len(data)]
+
+    def write_array(self, typecode, values):
+        if not isinstance(values, array) or values.typecode != typecode:
+            values = array(typecode, values)
+        return self.write(values.tobytes()) + [typecode]
+
+    def write_strings(self, values):
+        encoded = [v.encode('utf-8') for v in values]
+        offsets = array('q', [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        return {
+            'offsets': self.write_array('q', offsets),
+            'blob': self.write(b''.join(encoded))
+        }
+
+
+def write_shared(historical, path=None):
+    """Write historical data, with its time indexes, forward-fill tables,
+    daily rollups and hourly grids, into a file that other processes can map.
+
+    Notes:
+        The file starts with a magic number and the offset of a JSON footer
+        that describes where each array lives. Arrays are 8 byte aligned so
+        they can be mapped directly.
+
+    Args:
+        historical (HistoricalData)
+        path (str): defaults to default_shared_path().
+
+    Returns:
+        str: the path.
+    """
+    path = path or default_shared_path()
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', 0))
+        writer = _SegmentWriter(f)
+        partitions = []
+        for year in historical.years:
+            p = historical.partition(year)
+            n = len(p)
+            partitions.append({
+                'year': year,
+                'fields': list(p.fields),
+                'times': writer.write_array('q', p.times[:n]),
+                'columns': {
+                    field: writer.write_strings(p.columns[field][:n])
+                    for field in p.fields
+                },
+                'filled': {
+                    field: writer.write_array('q', p.filled[field][:n])
+                    for field in p.fields
+                },
+                'daily': {
+                    name: writer.write_array(getattr(p, name).typecode,
+                                             getattr(p, name))
+                    for name in p.daily_tables
+                },
+                'hourly': {
+                    field: writer.write_array(table.typecode, table)
+                    for field, table in p.hourly.items()
+                }
+            })
+        footer = f.tell()
+        f.write(json.dumps({'partitions': partitions}).encode('utf-8'))
+        f.seek(len(MAGIC))
+        f.write(struct.pack('<Q', footer))
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def attach_shared(path):
+    """Map historical data written by write_shared.
+
+    Notes:
+        Nothing is parsed or copied: the returned object reads straight from
+        the mapped pages, which every process attached to the same file
+        shares. The data is read-only.
+
+    Args:
+        path (str)
+
+    Returns:
+        HistoricalData
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError('{} is not a shared data segment'.format(path))
+    footer = struct.unpack('<Q', buf[len(MAGIC):len(MAGIC) + 8])[0]
+    header = json.loads(str(buf[footer:], 'utf-8'))
+
+    def view(spec):
+        offset, length = spec[0], spec[1]
+        v = buf[offset:offset + length]
+        return v.cast(spec[2]) if len(spec) > 2 else v
+
+    partitions = {}
+    for p in header['partitions']:
+        partitions[p['year']] = YearPartition(
+            p['year'],
+            p['fields'],
+            view(p['times']),
+            {field: PackedStrings(view(c['offsets']), view(c['blob']))
+             for field, c in p['columns'].items()},
+            filled={field: view(spec) for field, spec in p['filled'].items()},
+            daily={name: view(spec) for name, spec in p['daily'].items()},
+            hourly={field: view(spec) for field, spec in p['hourly'].items()}
+        )
+    historical = HistoricalData(partitions)
+    historical.segment = mm
+    return historical
@@ -0,0 +1,280 @@
+import collections
+import datetime
+import os
+import signal
+import threading
+import time
+import traceback
+
+from .climate import MonthlyNormals
+from .data import HISTORICAL_DATA_PATH, HISTORICAL_STATION, \
+                  INCREMENTS_DIRECTORY, increment_paths, load_historical_data
+from .historical import HistoricalData
+
+DATA_DIRECTORY = os.path.dirname(HISTORICAL_DATA_PATH)
+
+
+def load_historical():
+    """Load HISTORICAL_STATION's readings from the default historical data
+    file, plus every increment file.
+
+    Returns:
+        HistoricalData
+    """
+    stations = {HISTORICAL_STATION}
+    historical = HistoricalData.load(stations=stations)
+    for path in increment_paths():
+        historical = historical.appended(
+            load_historical_data(path, stations=stations)
+        )
+    return historical
+
+
+class Snapshot(collections.namedtuple('Snapshot',
+                                      ['historical', 'normals', 'loaded_at'])):
+    """An immutable set of the data that forecasts are built from.
+
+    Notes:
+        A Forecast holds on to the snapshot that was current when it was
+        created, so swapping in a new snapshot never changes a forecast that
+        is being built. Old snapshots are freed when the last forecast using
+        them is.
+    """
+
+    @classmethod
+    def load(cls, historical=None, normals=None):
+        """Load a snapshot.
+
+        Args:
+            historical (HistoricalData): defaults to load_historical(), with
+            its event index built.
+            normals (MonthlyNormals): defaults to MonthlyNormals.load().
+
+        Returns:
+            Snapshot
+        """
+        if historical is None:
+            historical = load_historical()
+            historical.events()
+        return cls(
+            historical,
+            normals if normals is not None else MonthlyNormals.load(),
+            datetime.datetime.now()
+        )
+
+    def appended(self, rows):
+        """Get a snapshot with new readings added.
+
+        Args:
+            rows (list): see HistoricalData.appended.
+
+        Returns:
+            Snapshot
+        """
+        return self._replace(historical=self.historical.appended(rows),
+                             loaded_at=datetime.datetime.now())
+
+
+class SnapshotManager:
+    """Holds the current snapshot and replaces it when data changes.
+
+    Notes:
+        New snapshots are built on a background thread and swapped in with a
+        single assignment, so readers never wait on a reload and never see a
+        half-built snapshot.
+    """
+
+    def __init__(self, loader=Snapshot.load):
+        """Constructor
+
+        Args:
+            loader (function): takes no arguments and returns a Snapshot.
+        """
+        self.loader = loader
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_pending = False
+        self._stations = {}
+        # Functions called with each snapshot that is swapped in.
+        self.listeners = []
+
+    def current(self):
+        """Get the current snapshot, loading the first one if necessary.
+
+        Returns:
+            Snapshot
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._snapshot = self.loader()
+                snapshot = self._snapshot
+        return snapshot
+
+    def swap(self, snapshot):
+        """Make a snapshot current.
+
+        Args:
+            snapshot (Snapshot)
+
+        Returns:
+            Snapshot: the previous snapshot, or None.
+        """
+        previous, self._snapshot = self._snapshot, snapshot
+        self._stations = {}
+        for listener in self.listeners:
+            listener(snapshot)
+        return previous
+
+    def for_station(self, station, path=HISTORICAL_DATA_PATH):
+        """Get a snapshot of one station's readings, e.g. to forecast with
+        weather from a station picked with StationCatalog.
+
+        Notes:
+            Station snapshots carry the station's own monthly normals, or
+            None if there are none, in which case normalized scenarios raise
+            ValueError. They are loaded once and dropped whenever a new
+            snapshot is swapped in.
+
+        Args:
+            station (str): a station id.
+            path (str): the NCEI file with the station's readings, see
+            Station.path.
+
+        Returns:
+            Snapshot
+        """
+        stations = self._stations
+        snapshot = stations.get(station)
+        if snapshot is None:
+            current = self._snapshot
+            with self._load_lock:
+                snapshot = stations.get(station)
+                if snapshot is None:
+                    historical = HistoricalData.load(path,
+                                                     stations={station})
+                    historical.events()
+                    if current is not None and \
+                            current.normals is not None and \
+                            current.normals.is_for(station):
+                        normals = current.normals
+                    else:
+                        normals = MonthlyNormals.for_station(station)
+                    snapshot = Snapshot(historical, normals,
+                                        datetime.datetime.now())
+                    stations[station] = snapshot
+        return snapshot
+
+    def reload(self, background=True):
+        """Build a new snapshot and swap it in.
+
+        Notes:
+            If a reload is already running, another one is run once it
+            finishes, so that changes made during a reload are picked up.
+
+        Args:
+            background (bool): build the snapshot on a new thread.
+
+        Returns:
+            threading.Thread: the thread doing the reload, or None if
+            background is False. If the reload was merged into a running one,
+            the thread exits right away.
+        """
+        if background:
+            thread = threading.Thread(target=self._reload, daemon=True)
+            thread.start()
+            return thread
+        self._reload()
+
+    def _reload(self):
+        self._reload_pending = True
+        while self._reload_pending:
+            if not self._reload_lock.acquire(blocking=False):
+                return
+            try:
+                while self._reload_pending:
+                    self._reload_pending = False
+                    self.swap(self.loader())
+            finally:
+                self._reload_lock.release()
+
+    def append(self, rows):
+        """Add new readings to the current snapshot and swap it in.
+
+        Args:
+            rows (list): see HistoricalData.appended.
+        """
+        with self._reload_lock:
+            self.swap(self.current().appended(rows))
+        if self._reload_pending:
+            self._reload()
+
+    def install_signal_handler(self, signum=signal.SIGHUP):
+        """Reload when the process receives a signal, e.g. `kill -HUP <pid>`.
+
+        Notes:
+            This must be called from the main thread.
+
+        Args:
+            signum (int): the signal number.
+        """
+        signal.signal(signum, lambda signum, frame: self.reload())
+
+    def watch(self, directory=DATA_DIRECTORY, interval=5.0,
+              increments=INCREMENTS_DIRECTORY):
+        """Reload whenever files in a directory change.
+
+        Notes:
+            The directory is polled on a daemon thread. A reload starts once
+            a change has been stable for one polling interval, so that
+            half-written files are not loaded. New increment files are
+            appended to the current snapshot instead of reloading it.
+
+        Args:
+            directory (str): the directory to watch.
+            interval (float): seconds between polls.
+            increments (str): the increments directory.
+
+        Returns:
+            threading.Thread: the polling thread.
+        """
+        def signature():
+            try:
+                return sorted(
+                    (e.name, e.stat().st_mtime_ns, e.stat().st_size)
+                    for e in os.scandir(directory) if e.is_file()
+                )
+            except OSError:
+                return None
+
+        def poll():
+            loaded = signature()
+            seen = loaded
+            applied = set(increment_paths(increments))
+            while True:
+                time.sleep(interval)
+                try:
+                    current = signature()
+                    if current != loaded and current == seen:
+                        loaded = current
+                        applied = set(increment_paths(increments))
+                        self.reload(background=False)
+                    seen = current
+                    for path in increment_paths(increments):
+                        if path not in applied:
+                            self.append(load_historical_data(
+                                path, stations={HISTORICAL_STATION}
+                            ))
+                            applied.add(path)
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        return thread
+
+
+# The snapshot forecasts use unless they are given one.
+snapshots = SnapshotManager()
@@ -0,0 +1,285 @@
+import collections
+import heapq
+import math
+
+from .data import HISTORICAL_DATA_PATH, iter_historical_chunks
+from .historical import parse_number
+
+EARTH_RADIUS_KM = 6371.0
+
+STATION_FIELDS = (
+    'STATION',
+    'NAME',
+    'LATITUDE',
+    'LONGITUDE',
+    'ELEVATION',
+    'DATE',
+    'HourlyDryBulbTemperature'
+)
+
+
+class Station(collections.namedtuple('Station', ['id', 'name', 'latitude',
+                                                 'longitude', 'elevation',
+                                                 'path'])):
+    """A weather station, and the file its readings come from."""
+
+
+def unit_vector(latitude, longitude):
+    """Get the point on the unit sphere for a latitude and longitude.
+
+    Notes:
+        Straight line distances between these points grow with great circle
+        distances, so a k-d tree over them finds the nearest places on the
+        globe, across the poles and the antimeridian too.
+
+    Args:
+        latitude (float): in degrees.
+        longitude (float): in degrees.
+
+    Returns:
+        tuple: (x, y, z)
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon),
+            math.cos(lat) * math.sin(lon),
+            math.sin(lat))
+
+
+def chord_to_km(chord):
+    """Convert a distance between unit vectors to kilometers along the
+    surface of the earth.
+
+    Args:
+        chord (float)
+
+    Returns:
+        float
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """A k-d tree for nearest neighbour queries over a fixed set of points.
+
+    Notes:
+        The tree is implicit: points are ordered so that the median of each
+        range splits it on one axis, cycling through axes by depth, and no
+        node objects are allocated.
+    """
+
+    def __init__(self, points):
+        """Constructor
+
+        Args:
+            points (list): tuples of the same length.
+        """
+        self.points = [tuple(p) for p in points]
+        self.k = len(self.points[0]) if self.points else 0
+        self.order = list(range(len(self.points)))
+        self._build(0, len(self.order), 0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, lo, hi, depth):
+        if hi - lo <= 1:
+            return
+        axis = depth % self.k
+        self.order[lo:hi] = sorted(self.order[lo:hi],
+                                   key=lambda i: self.points[i][axis])
+        mid = (lo + hi) // 2
+        self._build(lo, mid, depth + 1)
+        self._build(mid + 1, hi, depth + 1)
+
+    def nearest(self, point, n=1):
+        """Find the points closest to a point.
+
+        Args:
+            point (tuple): k coordinates.
+            n (int): the number of points to return.
+
+        Returns:
+            list: (index, distance) tuples, closest first, where index is the
+            position of the point in the list the tree was built from.
+        """
+        heap = []
+
+        def search(lo, hi, depth):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            i = self.order[mid]
+            p = self.points[i]
+            d = sum((a - b) * (a - b) for a, b in zip(point, p))
+            if len(heap) < n:
+                heapq.heappush(heap, (-d, i))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, i))
+            axis = depth % self.k
+            diff = point[axis] - p[axis]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            search(near[0], near[1], depth + 1)
+            if len(heap) < n or diff * diff < -heap[0][0]:
+                search(far[0], far[1], depth + 1)
+
+        if n > 0:
+            search(0, len(self.order), 0)
+        return [(i, math.sqrt(-d))
+                for d, i in sorted(heap, key=lambda e: (-e[0], e[1]))]
+
+
+class StationCatalog:
+    """Every station that historical data is available for.
+
+    Notes:
+        Stations are indexed twice: by location, to find the stations nearest
+        a place, and by climate, to find stations with weather like another
+        one's. A station's climate is its mean daily temperature in each month
+        over every year, like YearPartition.monthly_means.
+    """
+
+    def __init__(self, stations, climates=None):
+        """Constructor
+
+        Args:
+            stations (list): Station objects.
+            climates (dict): station id -> 12 monthly mean temperatures.
+            Stations without a climate, or with months missing, are left out
+            of climate queries.
+        """
+        self.stations = list(stations)
+        self.by_id = {s.id: s for s in self.stations}
+        self.climates = climates or {}
+        self._locations = KDTree([unit_vector(s.latitude, s.longitude)
+                                  for s in self.stations])
+        self._climate_stations = [
+            s for s in self.stations
+            if s.id in self.climates and
+            not any(math.isnan(v) for v in self.climates[s.id])
+        ]
+        self._climate = KDTree([self.climates[s.id]
+                                for s in self._climate_stations])
+
+    @classmethod
+    def load(cls, paths=(HISTORICAL_DATA_PATH,)):
+        """Build a catalog from NCEI files.
+
+        Notes:
+            Each file is streamed once. Station metadata comes from the first
+            row with a location, and climates are built from daily means as
+            rows go by.
+
+        Args:
+            paths (list): .csv or .csv.gz NCEI files.
+
+        Returns:
+            StationCatalog
+        """
+        stations = {}
+        # station id -> [sum of daily means, number of days], by month.
+        months = {}
+
+        def add_day():
+            if day_count:
+                m = months.setdefault(day_key[0],
+                                      [[0.0, 0] for _ in range(12)])
+                month = m[int(day_key[1][5:7]) - 1]
+                month[0] += day_sum / day_count
+                month[1] += 1
+
+        for path in paths:
+            day_key = None
+            day_sum = 0.0
+            day_count = 0
+            for chunk in iter_historical_chunks(path, STATION_FIELDS):
+                for station, name, lat, lon, elevation, date, t in chunk:
+                    if station not in stations:
+                        latitude = parse_number(lat)
+                        longitude = parse_number(lon)
+                        if latitude is not None and longitude is not None:
+                            stations[station] = Station(
+                                station, name, latitude, longitude,
+                                parse_number(elevation), path
+                            )
+                    key = (station, date[:10])
+                    if key != day_key:
+                        add_day()
+                        day_key, day_sum, day_count = key, 0.0, 0
+                    t = parse_number(t)
+                    if t is not None:
+                        day_sum += t
+                        day_count += 1
+            add_day()
+
+        climates = {
+            station: tuple(s / c if c else float('nan') for s, c in m)
+            for station, m in months.items()
+        }
+        return cls(
+            sorted(stations.values(), key=lambda s: s.id),
+            climates
+        )
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def __getitem__(self, station_id):
+        return self.by_id[station_id]
+
+    def nearest(self, latitude, longitude, n=5):
+        """Find the stations nearest to a place.
+
+        Args:
+            latitude (float): in degrees.
+            longitude (float): in degrees.
+            n (int): the number of stations to return.
+
+        Returns:
+            list: (Station, kilometers) tuples, nearest first.
+        """
+        return [
+            (self.stations[i], chord_to_km(d))
+            for i, d in self._locations.nearest(
+                unit_vector(latitude, longitude), n
+            )
+        ]
+
+    def similar(self, station_id, n=5):
+        """Find the stations with the climate most like another station's.
+
+        Args:
+            station_id (str)
+            n (int): the number of stations to return.
+
+        Returns:
+            list: (Station, distance) tuples, most similar first. The distance
+            is the root of the summed squared differences of monthly mean
+            temperatures, in Fahrenheit. Empty if the station has no climate.
+        """
+        climate = self.climates.get(station_id)
+        if climate is None or any(math.isnan(v) for v in climate):
+            return []
+        return [
+            (s, d) for s, d in self.like(climate, n + 1)
+            if s.id != station_id
+        ][:n]
+
+    def like(self, climate, n=5):
+        """Find the stations with the climate most like a given one.
+
+        Args:
+            climate (tuple): 12 monthly mean temperatures in Fahrenheit.
+            n (int): the number of stations to return.
+
+        Returns:
+            list: (Station, distance) tuples, most similar first.
+        """
+        return [(self._climate_stations[i], d)
+                for i, d in self._climate.nearest(tuple(climate), n)]
@@ -0,0 +1,172 @@
+import datetime
+import threading
+import traceback
+
+from .classes import Forecast
+from .snapshot import snapshots
+
+# Locations to keep timelines for: name -> Forecast keyword arguments, e.g.
+# {'austin': {'station': '72254013904', 'warming': 2}}.
+TIMELINE_LOCATIONS = {'default': {}}
+
+TIMELINE_HOURS = 48
+
+
+def floor_hour(dt):
+    """Get the start of the hour a datetime falls in.
+
+    Args:
+        dt (datetime.datetime)
+
+    Returns:
+        datetime.datetime
+    """
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def compute_forecast(dt, **options):
+    """Compute a forecast payload.
+
+    Args:
+        dt (datetime.datetime)
+        options: passed through to Forecast.
+
+    Returns:
+        dict: see Forecast.asdict.
+    """
+    return Forecast(dt, **options).asdict()
+
+
+class TimelineScheduler:
+    """Keeps the next hours of forecasts for each location precomputed.
+
+    Notes:
+        Each location has a timeline: a dict from the start of each hour to
+        that hour's Forecast.asdict() payload. A background thread wakes a
+        little before every hour boundary and computes the hour that just
+        entered the window, so serving a forecast is a dictionary lookup and
+        the work is spread over the hour instead of landing on the boundary.
+        Timelines are rebuilt when a new snapshot is swapped in.
+    """
+
+    def __init__(self, locations=None, hours=TIMELINE_HOURS, lead=120,
+                 forecast=compute_forecast, manager=snapshots):
+        """Constructor
+
+        Args:
+            locations (dict): name -> Forecast keyword arguments. Defaults to
+            TIMELINE_LOCATIONS.
+            hours (int): the number of hours to keep ahead of now.
+            lead (float): seconds before each hour boundary to refresh.
+            forecast (function): takes a datetime and Forecast keyword
+            arguments and returns a payload.
+            manager (SnapshotManager): rebuild timelines when it swaps in a
+            new snapshot.
+        """
+        self.locations = locations if locations is not None else \
+                         TIMELINE_LOCATIONS
+        self.hours = hours
+        self.lead = lead
+        self.forecast = forecast
+        self.manager = manager
+        self._timelines = {name: {} for name in self.locations}
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def get(self, location='default', dt=None):
+        """Get the forecast payload for an hour.
+
+        Notes:
+            Hours outside the timeline, e.g. before the first refresh, are
+            computed on the spot and kept.
+
+        Args:
+            location (str): a key of self.locations.
+            dt (datetime.datetime): defaults to now.
+
+        Raises:
+            KeyError: for an unknown location.
+
+        Returns:
+            dict: see Forecast.asdict.
+        """
+        options = self.locations[location]
+        hour = floor_hour(dt or datetime.datetime.now())
+        timeline = self._timelines[location]
+        payload = timeline.get(hour)
+        if payload is None:
+            payload = self.forecast(hour, **options)
+            timeline[hour] = payload
+        return payload
+
+    def refresh(self, now=None):
+        """Bring every timeline up to date.
+
+        Notes:
+            Past hours are dropped and missing hours are computed, from the
+            current hour through self.hours after the hour that starts within
+            self.lead seconds. Each timeline is replaced with a single
+            assignment, so readers never see a half-built one.
+
+        Args:
+            now (datetime.datetime): defaults to now.
+
+        Returns:
+            int: the number of payloads computed.
+        """
+        now = now or datetime.datetime.now()
+        first = floor_hour(now)
+        last = floor_hour(now + datetime.timedelta(seconds=self.lead)) + \
+               datetime.timedelta(hours=self.hours + 1)
+        computed = 0
+        with self._refresh_lock:
+            snapshot = self.manager.current()
+            stale = snapshot is not self._snapshot
+            self._snapshot = snapshot
+            for name, options in self.locations.items():
+                old = {} if stale else self._timelines.get(name, {})
+                timeline = {}
+                hour = first
+                while hour < last:
+                    payload = old.get(hour)
+                    if payload is None:
+                        payload = self.forecast(hour, **options)
+                        computed += 1
+                    timeline[hour] = payload
+                    hour += datetime.timedelta(hours=1)
+                self._timelines[name] = timeline
+        return computed
+
+    def start(self):
+        """Fill the timelines and keep them up to date on a daemon thread.
+
+        Returns:
+            threading.Thread: the refresher thread.
+        """
+        if self._thread is not None:
+            return self._thread
+        self.manager.listeners.append(lambda snapshot: self._wake.set())
+
+        def run():
+            while True:
+                self._wake.clear()
+                try:
+                    self.refresh()
+                except Exception:
+                    traceback.print_exc()
+                now = datetime.datetime.now()
+                boundary = floor_hour(now) + datetime.timedelta(hours=1)
+                wait = (boundary - now).total_seconds() - self.lead
+                if wait <= 0:
+                    wait += 3600
+                self._wake.wait(wait)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+# The timelines the web display and cli.py serve forecasts from.
+timelines = TimelineScheduler()
@@ -1,6 +1,50 @@
 import datetime
+import gzip
+import math
+import os
+import random
+import tempfile
 import unittest
-from speculative_weather_report import Weather
+import xml.etree.ElementTree as ElementTree
+from speculative_weather_report import HistoricalData, MonthlyNormals, \
+                                       Scenario, Snapshot, Weather, \
+                                       YearPartition, iter_historical_chunks
+from speculative_weather_report.classes import HourlyWeather, clock_time
+from speculative_weather_report.climate import heat_index, heat_indexes
+from speculative_weather_report.data import BlockStore, open_block_store, \
+                                            pack_blocks
+from speculative_weather_report.events import weather_codes
+from speculative_weather_report.export import parse_step, select_fields
+from speculative_weather_report.icons import ICONS, build_sprite, icon_for
+from speculative_weather_report.query import query_field
+from speculative_weather_report.shared import attach_shared, write_shared
+from speculative_weather_report.snapshot import SnapshotManager
+from speculative_weather_report.stations import KDTree, StationCatalog
+from speculative_weather_report.timeline import TimelineScheduler
+
+LCD_HEADERS = ['STATION', 'DATE', 'REPORT_TYPE', 'HourlyDryBulbTemperature',
+               'HourlyRelativeHumidity']
+
+
+def rain_partition():
+    # Hourly readings with rain reported once, then a long gap.
+    rows = [('2010-05-01T{:02d}:51:00'.format(h), str(60 + h),
+             '-RA:02 |RA |RA' if h == 3 else '')
+            for h in range(6)]
+    rows.append(('2010-05-01T12:51:00', '70', ''))
+    return YearPartition.from_rows(
+        2010,
+        ('DATE', 'HourlyDryBulbTemperature', 'HourlyPresentWeatherType'),
+        rows
+    )
+
+
+def write_lcd_csv(path, rows, headers=LCD_HEADERS):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        f.write(','.join('"{}"'.format(h) for h in headers) + '\n')
+        for row in rows:
+            f.write(','.join('"{}"'.format(v) for v in row) + '\n')
 
 
 class TestWeather(unittest.TestCase):
@@ -12,5 +56,452 @@ class TestWeather(unittest.TestCase):
         )
 
 
+class TestLoader(unittest.TestCase):
+    def test_iter_historical_chunks(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'lcd.csv.gz')
+            write_lcd_csv(path, [
+                ('A', '2010-05-01T00:51:00', 'FM-15', '60', '50'),
+                ('B', '2010-05-01T00:52:00', 'FM-15', '61', '51'),
+                ('A', '2010-05-01T01:51:00', 'FM-15', '62', '52'),
+                ('A', '2010-05-02T00:51:00', 'FM-15', '63', '53')
+            ])
+            chunks = list(iter_historical_chunks(
+                path,
+                ('DATE', 'HourlyDryBulbTemperature', 'HourlyVisibility'),
+                stations={'A'},
+                end=datetime.datetime(2010, 5, 2),
+                chunk_size=1
+            ))
+        self.assertEqual(chunks, [
+            [('2010-05-01T00:51:00', '60', '')],
+            [('2010-05-01T01:51:00', '62', '')]
+        ])
+
+
+class TestHistoricalData(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'lcd.csv')
+        write_lcd_csv(self.path, [
+            ('A', '2010-05-01T00:51:00', 'FM-15', '60', '50'),
+            ('A', '2010-05-01T01:51:00', 'FM-15', '', '52'),
+            ('A', '2010-05-01T02:51:00', 'FM-15', '70s', '52'),
+            ('A', '2011-05-01T00:51:00', 'FM-15', '40', '53')
+        ])
+        self.fields = ('DATE', 'HourlyDryBulbTemperature')
+        self.historical = HistoricalData.load(self.path, self.fields)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_partitions(self):
+        self.assertEqual(self.historical.years, [2010, 2011])
+        p = self.historical.partition(2010)
+        i = p.closest_past_index(datetime.datetime(2019, 5, 1, 2, 0))
+        self.assertEqual(i, 1)
+        self.assertEqual(p.value('HourlyDryBulbTemperature', i), '60')
+        self.assertEqual(
+            p.daily_summary(datetime.datetime(2019, 5, 1), 'max'),
+            70
+        )
+
+    def test_query_field(self):
+        rows = list(query_field(
+            self.historical,
+            'HourlyDryBulbTemperature',
+            start=datetime.datetime(2010, 5, 1, 1, 0),
+            fill=True
+        ))
+        self.assertEqual(
+            [r['HourlyDryBulbTemperature'] for r in rows],
+            ['60', '70s', '40']
+        )
+        rows = list(query_field(
+            self.historical,
+            'HourlyDryBulbTemperature',
+            period='day',
+            aggregates=['min', 'p50', 'count']
+        ))
+        self.assertEqual(rows[0], {
+            'dt': datetime.datetime(2010, 5, 1),
+            'min': 60.0,
+            'p50': 65.0,
+            'count': 2
+        })
+
+    def test_hourly_value(self):
+        p = self.historical.partition(2010)
+        self.assertEqual(
+            p.hourly_value('HourlyDryBulbTemperature',
+                           datetime.datetime(2019, 5, 1, 1, 0)),
+            '61'
+        )
+        self.assertEqual(
+            p.hourly_value('HourlyDryBulbTemperature',
+                           datetime.datetime(2019, 5, 1, 2, 0)),
+            '66'
+        )
+        self.assertEqual(
+            p.hourly_value('DATE', datetime.datetime(2019, 5, 1, 2, 0)),
+            '2010-05-01T01:51:00'
+        )
+
+    def test_hourly_gaps(self):
+        p = rain_partition()
+        dt = datetime.datetime(2019, 5, 1)
+        weather = [p.hourly['HourlyPresentWeatherType'][p.hour_index(
+            dt.replace(hour=h))] for h in (3, 4, 5, 7)]
+        self.assertEqual([p.columns['HourlyPresentWeatherType'][i]
+                          for i in weather[:3]], ['', '-RA:02 |RA |RA', ''])
+        self.assertEqual(weather[3], -1)
+        self.assertEqual(p.hourly_value('HourlyPresentWeatherType',
+                                        dt.replace(hour=9)), '')
+        temperature = p.hourly['HourlyDryBulbTemperature']
+        self.assertEqual(temperature[p.hour_index(dt)], 60)
+        self.assertTrue(math.isnan(
+            temperature[p.hour_index(dt - datetime.timedelta(hours=2))]
+        ))
+        self.assertTrue(math.isnan(
+            temperature[p.hour_index(dt.replace(hour=9))]
+        ))
+        self.assertEqual(temperature[p.hour_index(dt.replace(hour=13))], 70)
+
+    def test_appended(self):
+        appended = self.historical.appended([
+            ('2011-05-01T00:51:00', '40'),
+            ('2011-05-01T01:51:00', ''),
+            ('2011-05-01T02:51:00', '50'),
+            ('2012-01-01T00:51:00', '10')
+        ], self.fields)
+        self.assertEqual(appended.years, [2010, 2011, 2012])
+        self.assertEqual(len(self.historical.partition(2011)), 1)
+        p = appended.partition(2011)
+        self.assertEqual(len(p), 3)
+        self.assertEqual(p.value('HourlyDryBulbTemperature', 1), '40')
+        self.assertEqual(
+            p.daily_summary(datetime.datetime(2019, 5, 1), 'max'),
+            50
+        )
+        self.assertEqual(
+            p.hourly_value('HourlyDryBulbTemperature',
+                           datetime.datetime(2019, 5, 1, 2, 0)),
+            '46'
+        )
+        self.assertRaises(
+            ValueError,
+            appended.appended,
+            [('2011-12-31T00:51:00', '10')],
+            self.fields
+        )
+
+    def test_shared(self):
+        path = write_shared(
+            self.historical,
+            os.path.join(self.dir.name, 'shared.bin')
+        )
+        shared = attach_shared(path)
+        self.assertEqual(shared.years, [2010, 2011])
+        p = shared.partition(2010)
+        i = p.closest_past_index(datetime.datetime(2019, 5, 1, 2, 0))
+        self.assertEqual(p.value('HourlyDryBulbTemperature', i), '60')
+        self.assertEqual(p.columns['DATE'][-1], '2010-05-01T02:51:00')
+        self.assertEqual(
+            p.daily_summary(datetime.datetime(2019, 5, 1), 'mean'),
+            65
+        )
+
+    def test_shared_appended(self):
+        path = write_shared(
+            self.historical,
+            os.path.join(self.dir.name, 'shared.bin')
+        )
+        shared = attach_shared(path)
+        appended = shared.appended([
+            ('2011-05-01T01:51:00', '50')
+        ], self.fields)
+        p = appended.partition(2011)
+        self.assertEqual(len(p), 2)
+        self.assertEqual(
+            p.daily_summary(datetime.datetime(2019, 5, 1), 'max'),
+            50
+        )
+        self.assertEqual(
+            p.hourly_value('HourlyDryBulbTemperature',
+                           datetime.datetime(2019, 5, 1, 1, 0)),
+            '42'
+        )
+        self.assertEqual(len(shared.partition(2011)), 1)
+
+    def test_events(self):
+        events = self.historical.events()
+        self.assertEqual(events.find_days(min_temperature=65),
+                         [datetime.date(2010, 5, 1)])
+        self.assertEqual(events.find_days(max_temperature=45, month=5),
+                         [datetime.date(2011, 5, 1)])
+        self.assertEqual(events.find_days(month=6), [])
+        self.assertEqual(events.find_analogs(40, 40, n=1),
+                         [datetime.date(2011, 5, 1)])
+
+    def test_blocks(self):
+        path = pack_blocks(self.path, self.path + '.blocks', self.fields)
+        store = BlockStore(path)
+        self.assertIs(open_block_store(path), open_block_store(path))
+        self.assertEqual(len(store.index), 2)
+        self.assertEqual(store.years(), [2010, 2011])
+        self.assertEqual(
+            store.blocks(start=datetime.datetime(2011, 1, 1)),
+            [1]
+        )
+        historical = HistoricalData.load(path, self.fields)
+        self.assertEqual(historical.partition(2010).columns,
+                         self.historical.partition(2010).columns)
+        window = HistoricalData.load_window(
+            path, datetime.datetime(2019, 4, 28), fields=self.fields
+        )
+        self.assertEqual(window.years, [2010, 2011])
+        window = HistoricalData.load_window(
+            path, datetime.datetime(2019, 1, 1), fields=self.fields
+        )
+        self.assertEqual(window.years, [])
+
+    def test_hourly_weather(self):
+        cell = HourlyWeather(datetime.datetime(2019, 5, 1, 2, 0), 2010,
+                             snapshot=Snapshot(self.historical, None, None))
+        self.assertFalse(hasattr(cell, '__dict__'))
+        self.assertEqual(cell.as_of(), '1:51AM')
+
+    def test_year_sampler(self):
+        year_for = self.historical.year_sampler('day', seed=1)
+        dt = datetime.datetime(2019, 5, 1, 2, 0)
+        self.assertEqual(year_for(dt), year_for(dt.replace(hour=20)))
+        self.assertEqual(self.historical.year_sampler(year=2011)(dt), 2011)
+        self.assertRaises(ValueError, year_for, dt.replace(month=6))
+        self.assertEqual(self.historical.years_by_day()[(5, 1)], (2010, 2011))
+        self.assertEqual(
+            len({self.historical.year_sampler('day')(dt) for _ in range(40)}),
+            2
+        )
+
+    def test_year_sampler_partial_years(self):
+        dt = datetime.datetime(2019, 5, 1, 2, 0)
+        self.assertRaises(ValueError, self.historical.year_sampler, dt=dt)
+        # 2011 has the whole week from May 1st, 2010 only May 1st.
+        historical = self.historical.appended([
+            ('2011-05-{:02d}T12:51:00'.format(day), '60')
+            for day in range(2, 8)
+        ], self.fields)
+        for seed in range(10):
+            self.assertEqual(historical.year_sampler(seed=seed, dt=dt)(dt),
+                             2011)
+
+
+class TestEvents(unittest.TestCase):
+    def test_weather_codes(self):
+        self.assertEqual(weather_codes('+TSRA:7 BR:1 |TS RA |'),
+                         {'TS', 'RA', 'BR'})
+        self.assertEqual(weather_codes('-SHRA:02 FZRA BLSN'),
+                         {'RA', 'FZRA', 'BLSN'})
+        self.assertEqual(weather_codes('VCTS BCFG'), {'TS', 'FG'})
+
+    def test_gaps(self):
+        index = HistoricalData({2010: rain_partition()}).events()
+        self.assertEqual(index.find_days(month=4), [])
+        self.assertEqual(index.find_days(weather=('RA',)),
+                         [datetime.date(2010, 5, 1)])
+        self.assertEqual(bin(index.indexes[2010].query(weather=('RA',)))
+                         .count('1'), 1)
+        self.assertEqual(index.find_days(hours_of_day=range(7, 12)), [])
+        self.assertEqual(index.find_days(hours_of_day=range(12, 14)),
+                         [datetime.date(2010, 5, 1)])
+
+
+class TestScenario(unittest.TestCase):
+    def test_view(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'lcd.csv')
+            write_lcd_csv(path, [
+                ('A', '2010-05-01T00:51:00', 'FM-15', '60', '50'),
+                ('A', '2010-05-01T01:51:00', 'FM-15', '', '52'),
+                ('A', '2010-06-01T01:51:00', 'FM-15', '70', '52'),
+            ])
+            historical = HistoricalData.load(
+                path,
+                ('DATE', 'HourlyDryBulbTemperature', 'HourlyRelativeHumidity')
+            )
+        normals = MonthlyNormals.load()
+        self.assertEqual(normals['MLY-TAVG-NORMAL'][4], 59.1)
+        self.assertEqual(
+            MonthlyNormals.for_station('72530094846').station,
+            normals.station
+        )
+        self.assertIsNone(MonthlyNormals.for_station('72254013904'))
+
+        p = historical.partition(2010)
+        view = Scenario(4).view(p)
+        self.assertEqual(view.value('HourlyDryBulbTemperature', 1), '64')
+        self.assertEqual(view.value('HourlyRelativeHumidity', 1), '52')
+        self.assertEqual(list(view.column('HourlyDryBulbTemperature', 0, 3)),
+                         [64.0, 64.0, 74.0])
+        self.assertEqual(
+            view.daily_summary(datetime.datetime(2019, 6, 1), 'max'),
+            74
+        )
+        hours = view.hourly_numbers('HourlyDryBulbTemperature', [
+            datetime.datetime(2019, 5, 1, 1, 0),
+            datetime.datetime(2019, 5, 1, 5, 0)
+        ])
+        self.assertEqual(hours[0], 64.0)
+        self.assertTrue(math.isnan(hours[1]))
+        self.assertEqual(
+            heat_indexes([90.0, float('nan'), 70.0], [50.0, 50.0, 50.0]),
+            [heat_index(90.0, 50.0), None, None]
+        )
+        self.assertIs(Scenario(0).view(p), p)
+        self.assertEqual(Scenario.for_carbon_count(560).warming, 2)
+
+
+class TestExport(unittest.TestCase):
+    def test_parse_step(self):
+        self.assertEqual(parse_step('90m'), datetime.timedelta(minutes=90))
+        self.assertRaises(ValueError, parse_step, '0h')
+
+    def test_select_fields(self):
+        d = {
+            'current_weather': {'temperature': 70, 'dew_point': 50},
+            'hourly': [{'temperature': 71, 'dt': 1},
+                       {'temperature': 72, 'dt': 2}],
+            'news': {}
+        }
+        self.assertEqual(
+            select_fields(d, ['current_weather.temperature',
+                              'hourly.temperature', 'news']),
+            {
+                'current_weather': {'temperature': 70},
+                'hourly': [{'temperature': 71}, {'temperature': 72}],
+                'news': {}
+            }
+        )
+
+
+class TestWeatherCells(unittest.TestCase):
+    def test_clock_time(self):
+        self.assertEqual(clock_time('2010-05-01T00:51:00'), '12:51AM')
+        self.assertEqual(clock_time('2010-05-01T14:05:00'), '2:05PM')
+
+
+class TestIcons(unittest.TestCase):
+    def test_icon_for(self):
+        self.assertEqual(icon_for('OVC', frozenset({'RA', 'BR'})), 'rain')
+        self.assertEqual(icon_for('OVC', weather_codes('+TSRA')), 'thunder')
+        self.assertEqual(icon_for('FEW', frozenset()), 'few-clouds')
+        self.assertEqual(icon_for(None, frozenset()), 'clear')
+
+    def test_build_sprite(self):
+        root = ElementTree.fromstring(build_sprite())
+        self.assertEqual(
+            sorted(s.get('id') for s in root),
+            sorted('icon-' + name for name in ICONS)
+        )
+
+
+class TestSnapshotManager(unittest.TestCase):
+    def test_reload(self):
+        loads = []
+        manager = SnapshotManager(lambda: loads.append(len(loads)) or
+                                  len(loads))
+        self.assertEqual(manager.current(), 1)
+        self.assertEqual(manager.current(), 1)
+        manager.reload().join()
+        self.assertEqual(manager.current(), 2)
+        manager.reload(background=False)
+        self.assertEqual(manager.current(), 3)
+
+    def test_for_station(self):
+        def loader():
+            raise AssertionError('for_station loaded the default data')
+        manager = SnapshotManager(loader)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'lcd.csv')
+            write_lcd_csv(path, [
+                ('A', '2010-05-01T00:51:00', 'FM-15', '60', '50'),
+                ('B', '2010-05-01T00:51:00', 'FM-15', '70', '50'),
+                ('99999900002', '2010-05-01T00:51:00', 'FM-15', '80', '50')
+            ])
+            snapshot = manager.for_station('B', path)
+            self.assertIsNone(snapshot.normals)
+            normals = MonthlyNormals('USW00000002', {})
+            manager.swap(Snapshot(None, normals, None))
+            self.assertIsNone(manager.for_station('B', path).normals)
+            self.assertIs(manager.for_station('99999900002', path).normals,
+                          normals)
+        self.assertEqual(
+            snapshot.historical.partition(2010).value(
+                'HourlyDryBulbTemperature', 0
+            ),
+            '70'
+        )
+
+
+class TestStationCatalog(unittest.TestCase):
+    def test_kd_tree(self):
+        rng = random.Random(1)
+        points = [(rng.random(), rng.random(), rng.random())
+                  for _ in range(200)]
+        tree = KDTree(points)
+        for _ in range(20):
+            q = (rng.random(), rng.random(), rng.random())
+            expected = sorted(
+                range(len(points)),
+                key=lambda i: sum((a - b) ** 2 for a, b in zip(q, points[i]))
+            )[:3]
+            self.assertEqual([i for i, d in tree.nearest(q, 3)], expected)
+
+    def test_load(self):
+        headers = ['STATION', 'DATE', 'LATITUDE', 'LONGITUDE', 'NAME',
+                   'HourlyDryBulbTemperature']
+        rows = []
+        for station, lat, lon, t in (('CHI', '41.99', '-87.93', 30),
+                                     ('MKE', '42.95', '-87.90', 28),
+                                     ('AUS', '30.18', '-97.68', 60)):
+            for m in range(1, 13):
+                rows.append((station, '2010-{:02}-01T00:51:00'.format(m),
+                             lat, lon, station, str(t + m)))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'lcd.csv')
+            write_lcd_csv(path, rows, headers)
+            catalog = StationCatalog.load([path])
+        self.assertEqual(len(catalog), 3)
+        [(chicago, km)] = catalog.nearest(41.88, -87.63, 1)
+        self.assertEqual(chicago.id, 'CHI')
+        self.assertLess(km, 30)
+        self.assertEqual(catalog.climates['AUS'][0], 61)
+        self.assertEqual([s.id for s, d in catalog.similar('CHI', 2)],
+                         ['MKE', 'AUS'])
+
+
+class TestTimelineScheduler(unittest.TestCase):
+    def test_refresh(self):
+        manager = SnapshotManager(lambda: 'snapshot')
+        timeline = TimelineScheduler(
+            {'default': {}, 'warm': {'warming': 2}},
+            hours=3,
+            lead=120,
+            forecast=lambda dt, warming=0: (dt.hour, warming),
+            manager=manager
+        )
+        now = datetime.datetime(2019, 5, 1, 11, 30)
+        self.assertEqual(timeline.refresh(now), 8)
+        self.assertEqual(timeline.get('warm', now), (11, 2))
+        self.assertEqual(timeline.refresh(now.replace(minute=59)), 2)
+        self.assertEqual(
+            timeline.get(dt=datetime.datetime(2019, 5, 1, 15, 10)),
+            (15, 0)
+        )
+        manager.swap('new snapshot')
+        self.assertEqual(timeline.refresh(now), 8)
+        self.assertRaises(KeyError, timeline.get, 'cold')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,14 +1,81 @@
-import datetime
+import hmac
+import os
+import signal
+import threading
 
 from speculative_weather_report import CurrentWeather, DailyWeather, \
-                                       Forecast, HourlyWeather, News, \
-                                       Sunrise, Sunset, Weather
+                                       HourlyWeather, News, Sunrise, Sunset, \
+                                       Weather
+from speculative_weather_report.icons import SPRITE_PATH, sprite_version, \
+                                             write_sprite
+from speculative_weather_report.shared import SHARED_DATA_ENV, attach_shared
+from speculative_weather_report.snapshot import Snapshot, snapshots
+from speculative_weather_report.timeline import timelines
 
-from flask import Flask, render_template
+from flask import Flask, abort, jsonify, render_template, request, \
+                  send_file, url_for
 app = Flask(__name__)
 app.debug = True
 
+# The icon sprite is built by `cli.py build_icons` or by the gunicorn master;
+# build it here when running without either.
+if not os.path.exists(SPRITE_PATH):
+    write_sprite()
+ICONS_VERSION = sprite_version()
+# The sprite's URL changes with its contents, so browsers can keep it forever.
+ICONS_MAX_AGE = 365 * 24 * 60 * 60
+
+# POST /admin/reload is enabled by setting this to a secret, which requests
+# send as `Authorization: Bearer <secret>`.
+ADMIN_TOKEN_ENV = 'SPECULATIVE_WEATHER_ADMIN_TOKEN'
+
+if os.environ.get(SHARED_DATA_ENV):
+    # Under gunicorn, the master writes new data and restarts workers on
+    # SIGHUP, so a reload here only needs to attach to the current segment.
+    # Timelines are started by gunicorn.conf.py once the worker is ready.
+    snapshots.loader = lambda: Snapshot.load(
+        attach_shared(os.environ[SHARED_DATA_ENV])
+    )
+else:
+    snapshots.watch()
+    # Signal handlers can only be installed from the main thread.
+    if threading.current_thread() is threading.main_thread():
+        snapshots.install_signal_handler()
+    timelines.start()
+
 @app.route('/', methods=['GET'])
 def index():
-    f = Forecast(datetime.datetime.now())
-    return render_template('weather.html', **f.asdict())
+    location = request.args.get('location', 'default')
+    if location not in timelines.locations:
+        abort(404)
+    return render_template(
+        'weather.html',
+        icons_url=url_for('icons', version=ICONS_VERSION),
+        **timelines.get(location)
+    )
+
+
+@app.route('/icons/<version>.svg', methods=['GET'])
+def icons(version):
+    if version != ICONS_VERSION:
+        abort(404)
+    response = send_file(SPRITE_PATH, mimetype='image/svg+xml')
+    response.headers['Cache-Control'] = \
+        'public, max-age={}, immutable'.format(ICONS_MAX_AGE)
+    return response
+
+
+@app.route('/admin/reload', methods=['POST'])
+def reload():
+    token = os.environ.get(ADMIN_TOKEN_ENV)
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''),
+                               'Bearer ' + token):
+        abort(403)
+    if os.environ.get(SHARED_DATA_ENV):
+        # Only the gunicorn master can load new data into a new segment.
+        os.kill(os.getppid(), signal.SIGHUP)
+    else:
+        snapshots.reload()
+    return jsonify({'reloading': True}), 202